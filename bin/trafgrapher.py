@@ -9,7 +9,7 @@ TrafGrapher collector
 Licensed under the MIT license.
 
 Usage: tgc.py [--mkcfg|-c [community@]IP_or_hostname[:port]] \\
-                [--entry Octets|Errors|Discards|] \\
+                [--entry Octets|Errors|Discards|Octets,Errors,...] \\
 		[--write|-w index.json] [--mkdir|-d] [--verbose|-v] \\
 		[--filter ifOperStatus|ifAdminStatus] \\
 		[--sensors-cisco|--sensors-huawei] \\
@@ -17,7 +17,27 @@ Usage: tgc.py [--mkcfg|-c [community@]IP_or_hostname[:port]] \\
        tgc.py [--verbose|-v] [community@]config.json \\
 		[--filter-time=timestamp|datetime] \\
 		[--filter-value=value=>value[kMGTP]] \\
-		[--merge-dir=directory]
+		[--merge-dir=directory] \\
+		[--jobs|-j N] [--deadline=seconds] \\
+		[--engine=netsnmp|asyncio] [--bulk] \\
+		[--daemon [--interval=seconds]] [--journal=seconds] \\
+		[--storage=text|binary|ring] \\
+		[--compact-budget=seconds] [--compact-max=N] [--index] \\
+		[--gzip] [--sum]
+       tgc.py --bench [community@]IP_or_hostname[:port] [ifIndex ...]
+       tgc.py --bench-storage file1.log [file2.log ...]
+       tgc.py --recompact directory [directory ...]
+       tgc.py --precompress [--brotli] directory [directory ...]
+       tgc.py --serve [--listen=[host:]port] [directory]
+       tgc.py --export [--from=time] [--to=time] [--since=time] \\
+		[--step=seconds] [--agg=avg|max|min] \\
+		[--points=N] [--column=i|o|I|O] file.log
+       tgc.py --total [--from=time] [--to=time] file.log [file2.log ...]
+       tgc.py --top N [--from=time] [--to=time] [--metric=avg|max|total] \\
+		[--jobs|-j N] directory|config.json [...]
+       tgc.py --maintain [--compress|-z] [--filter-time=timestamp|datetime] \\
+		[--filter-value=value] [--merge-dir=directory] [--jobs|-j N] \\
+		directory|config.json [...]
        tgc.py --ipset|--iptables|--nft \\
                 [-q|--quiet] download_cmd upload_cmd
        tgc.py --netdev [filename|URL] --override key:value
@@ -30,6 +50,19 @@ Examples:
   tgc index.json
   tgc index.json --filter-time='2015-07-04 02:00:00'
   tgc index.json --filter-value='>1T'
+  tgc --jobs 16 --deadline 50 */index.json
+  tgc --engine asyncio --deadline 50 */index.json
+  tgc --daemon --engine asyncio --interval 60 */index.json
+  tgc --journal 3600 */index.json
+  tgc --maintain -z --jobs 8 /var/www/trafgrapher
+  tgc --precompress --brotli /var/www/trafgrapher
+  tgc --serve --listen=127.0.0.1:8000 /var/www/trafgrapher
+  curl 'http://127.0.0.1:8000/sw1/sw1_1.log?from=1700000000&step=3600&agg=max'
+  curl 'http://127.0.0.1:8000/sw1/sw1_1.log?from=1700000000&points=800'
+  curl 'http://127.0.0.1:8000/sw1/sw1_1.log?since=1700000000'
+  tgc --export --from='2025-01-01 00:00:00' --points 800 --column O sw1_1.log
+  tgc --total --from='2025-01-01 00:00:00' --to='2025-02-01 00:00:00' sw1_1.log
+  tgc --top 20 --metric max --jobs 8 /var/www/trafgrapher
   tgc --ipset "ipset list acc_download" "ipset list acc_upload" [index_file]
   tgc --iptables "iptables -L acc_download -vxn" "iptables -L acc_upload -vxn"
   tgc --nft "nft -jN list set ip acc download" "nft -jN list set ip acc upload"
@@ -42,11 +75,20 @@ import sys
 import os
 import re
 import fcntl
+import mmap
+import signal
 import socket
 import time
 import json
+import threading
 import getopt
 import hashlib
+import random
+import itertools
+import heapq
+import zlib
+import struct
+from array import array
 from collections import defaultdict
 
 if sys.version_info[0] > 2:  # python3
@@ -54,6 +96,21 @@ if sys.version_info[0] > 2:  # python3
 
 VERBOSE = False
 QUIET = False
+SNMP_ENGINE = "netsnmp"
+SNMP_BULK = False
+SNMP_SESSIONS = None  # SNMP session cache for daemon mode
+CONFIG_CACHE = None  # parsed configs for daemon mode
+STORAGE = "text"  # logfile storage backend: text or binary
+JOURNAL = 0  # journal fan-out cadence in seconds, 0 = disabled
+COMPACT_BUDGET = 0  # seconds of daily compression per run, 0 = unlimited
+COMPACT_MAX = 0  # daily compressions per run, 0 = unlimited
+COMPACT_DONE = [0, 0.0]  # compressions and seconds spent in this run
+LOG_INDEX = False  # write sidecar time index for logfiles
+LOG_SUM = False  # write sidecars with cumulative bytes and daily summary
+ROLLUP_ROWS = 1500  # number of rows in rollup files
+PRECOMPRESS = []  # precompressed sidecars of logfiles: gz, br
+BUNDLES = set()  # bundle files being written by background threads
+BUNDLE_LOCK = threading.Lock()
 BACKUP = False
 INSECURE = False
 CONFIG_OVERRIDE = {}
@@ -452,8 +509,67 @@ OID_TABLE = dict(
 )
 
 
+class pdu_sizer:
+    '''
+    Learn number of varbinds per PDU for each agent from response times
+    and errors. Size grows slowly while agent responds fast and it is
+    halved on tooBig or timeout. Learned sizes are stored next to config.
+    '''
+    min_size = 2
+    max_size = 128
+    default_size = 16
+    slow = 1.0  # response time in seconds, when agent is overloaded
+
+    def __init__(self, config_file=None):
+        self.filename = None
+        self.sizes = {}
+        self.changed = False
+        if config_file:
+            self.filename = os.path.splitext(config_file)[0] + ".pdu.json"
+            try:
+                self.sizes = json.load(open(self.filename))
+            except (IOError, ValueError):
+                pass
+
+    def get(self, agent):
+        return self.sizes.get(agent, self.default_size)
+
+    def update(self, agent, size, elapsed, error=None):
+        current = self.get(agent)
+        if error == "tooBig":
+            current = min(current, size)//2
+        elif error == "timeout":
+            if size > current//2:
+                current //= 2  # small requests time out on dead agents
+        elif elapsed > self.slow:
+            current -= current//4
+        elif size >= current:
+            current += max(1, current//8)
+        current = max(self.min_size, min(self.max_size, current))
+        if current != self.get(agent):
+            self.sizes[agent] = current
+            self.changed = True
+
+    def save(self):
+        if self.filename and self.changed:
+            open(self.filename+".tmp", "wt").write(json.dumps(self.sizes))
+            os.rename(self.filename+".tmp", self.filename)
+            self.changed = False
+
+
+def entries(suffix):
+    '''
+    List of entries (Octets, Errors, Discards) from list or string
+    with comma separated entries.
+    '''
+    if isinstance(suffix, list):
+        return suffix
+    return suffix.split(",")
+
+
 class SNMP:
     port = 161
+    max_repetitions = 25
     sensor_datatypes = dict(enumerate(
         ",,,V,V,A,W,Hz,C,%,rpm,cmm,,,dBm".split(",")
     ))
@@ -464,6 +580,12 @@ class SNMP:
             self.port = int(port)
         else:
             self.addr = addr
+        self.requests = 0  # number of requests sent to agent
+        self.last_error = None
+        self.sizer = pdu_sizer()
+        self.connect(addr, community_name)
+
+    def connect(self, addr, community_name):
         # allow loading site-packages even for python -S
         import site
         site.main()
@@ -474,6 +596,9 @@ class SNMP:
         )
         self.varlist = VarList
 
+    def close(self):
+        pass
+
     def oid(self, prefix, suffix, *ids):
         if prefix == '' or suffix in OID_TABLE:
             if ids:
@@ -483,24 +608,118 @@ class SNMP:
                 return '.' + OID_TABLE.get(suffix, suffix)
         raise ValueError("Unable to convert OID")
 
-    def get_data(self, prefix, oids):
-        vars = self.varlist(*[
-            self.oid(prefix, x)
-            for x in oids
-        ])
-        count = len(oids)
-        varbind = self.session.walk(vars)
+    def var_index(self, var):
+        '''
+        Last number of variable OID.
+        '''
+        return int((var.iid or var.tag).rsplit('.', 1)[-1])
+
+    def agent(self):
+        return "%s:%d" % (self.addr, self.port)
+
+    def pdu_size(self):
+        return self.sizer.get(self.agent())
+
+    def learn(self, size, elapsed):
+        self.sizer.update(self.agent(), size, elapsed, self.last_error)
+
+    def check_error(self):
+        errnum = getattr(self.session, "ErrorNum", 0)
+        if errnum == 1:
+            self.last_error = "tooBig"
+        elif errnum == -24:  # SNMPERR_TIMEOUT
+            self.last_error = "timeout"
+        elif errnum:
+            self.last_error = self.session.ErrorStr or str(errnum)
+        else:
+            self.last_error = None
+
+    def get(self, oids):
+        '''
+        Get values for list of OIDs, None for missing values.
+        '''
+        self.requests += 1
+        vars = self.varlist(*oids)
+        start = time.time()
+        self.session.get(vars)
+        self.check_error()
+        self.learn(len(oids), time.time()-start)
+        return [x.val for x in vars]
+
+    def getmany(self, oids):
+        '''
+        Get values for any number of OIDs in PDUs of learned size.
+        PDU is halved on tooBig, single OID which is still too big
+        is returned as None.
+        '''
+        ret = []
+        oids = list(oids)
+        size = self.pdu_size()
+        while oids:
+            values = self.get(oids[:size])
+            if self.last_error == "tooBig":
+                if size > 1:
+                    size //= 2  # retry with smaller PDU
+                    continue
+                values = [None]
+            ret.extend(values)
+            oids = oids[size:]
+        return ret
+
+    def getnext(self, oids):
+        self.requests += 1
+        return list(self.session.getnext(self.varlist(*oids)))
+
+    def walk(self, oids):
+        '''
+        Walk OID columns, return list of variables ordered by rows.
+        '''
+        self.requests += 1
+        vars = self.varlist(*oids)
+        self.session.walk(vars)
+        return vars
+
+    def getbulk(self, oids, max_repetitions):
+        '''
+        GETBULK request, return list of variables ordered by rows.
+        '''
+        self.requests += 1
+        vars = self.varlist(*oids)
+        start = time.time()
+        self.session.getbulk(0, max_repetitions, vars)
+        self.check_error()
+        self.learn(len(oids)*max_repetitions, time.time()-start)
+        return vars
+
+    def var_oid(self, var):
+        '''
+        Numeric OID of variable, without leading dot.
+        '''
+        tag = OID_TABLE.get(var.tag, var.tag).strip(".")
+        if var.iid:
+            return tag + "." + var.iid
+        return tag
+
+    def data_rows(self, vars, count):
         # return itertools.batched(vars, len(oids))  # requires py3.12+
         return [
             vars[row:row+count]
             for row in range(0, len(vars), count)
         ]
 
+    def get_data(self, prefix, oids):
+        vars = self.walk([
+            self.oid(prefix, x)
+            for x in oids
+        ])
+        return self.data_rows(vars, len(oids))
+
     def get_info(self, ifid='ifIndex', log_prefix=None, oids=oids_info,
                  filter=None):
         if filter:
             oids[filter] = int
         ret = {}
+        rows = []
         for row in self.get_data("IF-MIB", oids):
             data = dict([
                 (x.tag, oids[x.tag](x.val))
@@ -513,24 +732,30 @@ class SNMP:
             #if "ifHCOutOctets" in data:
             #    print("hcout")
             #    data["ifOutOctets"] = data["ifHCOutOctets"]
-            # check IO retrieval
             ifindex = data['ifIndex']
             if ifindex.startswith('-'):
                 # fix broken negative values for Huawei
                 ifindex = str(2**32+long(ifindex))
-            io = self.getall([ifindex])
             if data.get("ifName", "") == "Nu0":
                 continue  # ignore Null interfaces
+            rows.append((ifindex, data))
+        # check IO retrieval, 64bit counters for all interfaces at once,
+        # then 32bit counters for interfaces without 64bit counters
+        ids = [ifindex for ifindex, data in rows]
+        io = self.getall(ids, bulk=True)
+        io32 = self.getall(
+            [x for x in ids if io[x]['error']], only32bit=True, bulk=True
+        )
+        for ifindex, data in rows:
             if io[ifindex]['error']:
                 #print("Unable to get 64bit IO for id %s [%s], trying 32bit ..."
                 #      % (ifindex, data.get("ifName", "")))
-                io = self.getall([ifindex], only32bit=True)
-                if io[ifindex]['error']:
+                if io32[ifindex]['error']:
                     #print("Unable to get IO for id %s [%s], ignoring ..."
                     #      % (ifindex, data.get("ifName", "")))
                     if VERBOSE:
                         print(data)
-                        print(io)
+                        print(io32[ifindex])
                     continue
                 else:
                     data["_counter_size"] = 32
@@ -571,7 +796,7 @@ class SNMP:
         )
         for row in self.get_data("", oids_sensor[:1]):
             if str(row[0].val).endswith(receive_sensor_string):
-                id = int(row[0].tag.rsplit('.', 1)[-1])
+                id = self.var_index(row[0])
                 interface = str(row[0].val).replace(receive_sensor_string, "")
                 datatype, scale, precision, value \
                     = self.getsome("", oids_sensor[1:], [id])
@@ -592,7 +817,7 @@ class SNMP:
     def get_key_value(self, prefix, type=str):
         return dict([
             # last oid number, value
-            (int(x[0].tag.rsplit('.', 1)[-1]), str(x[0].val))
+            (self.var_index(x[0]), str(x[0].val))
             for x in self.get_data("", {prefix: type})
         ])
 
@@ -621,63 +846,191 @@ class SNMP:
         return ret
 
     def get_uptime(self):
-        varbind = self.session.getnext(self.varlist(self.oid('', 'sysUpTime')))
+        return self.parse_uptime(self.getnext([self.oid('', 'sysUpTime')]))
+
+    def parse_uptime(self, varbind):
         if varbind[0] is None:
             print("%s: Unable to get uptime" % self.addr)
             return None
         return float(varbind[0])/100
 
-    def getblock(self, request, prefix, ifs, suffix="Octets"):
-        ret = {}
-        result = self.getsome(
+    def counter_columns(self, prefix, suffix="Octets"):
+        '''
+        In and Out counter columns for one or more entries (suffixes).
+        Only Octets have 64bit counters.
+        '''
+        columns = []
+        for sfx in entries(suffix):
+            if sfx != "Octets":
+                prefix = "if"
+            columns.extend([prefix+"In"+sfx, prefix+"Out"+sfx])
+        return columns
+
+    def block_oids(self, request, prefix, suffix="Octets"):
+        return self.some_oids(
             "IF-MIB",
-            [prefix+"In"+suffix, prefix+"Out"+suffix],
+            self.counter_columns(prefix, suffix),
             request
         )
+
+    def parse_block(self, request, result, ifs, suffix="Octets"):
+        ret = {}
         for id in request:
-            try:
-                ino = result.pop(0)
-                outo = result.pop(0)
-                ret[id] = {
-                    "ifIn"+suffix: long(ino),
-                    "ifOut"+suffix: long(outo),
-                    "error": None
-                }
-            except (AttributeError, IndexError, ValueError, TypeError) as err:
-                ret[id] = {
-                    "ifIn"+suffix: None,
-                    "ifOut"+suffix: None,
-                    "error": "No such instance: ip: %s:%d, id: %s [%s]"
-                             % (self.addr, self.port, id,
-                                ifs.get(id, {}).get("ifName", ""))
-                }
+            ret[id] = {"error": None}
+            for sfx in entries(suffix):
+                try:
+                    ino = result.pop(0)
+                    outo = result.pop(0)
+                    ret[id]["ifIn"+sfx] = long(ino)
+                    ret[id]["ifOut"+sfx] = long(outo)
+                except (AttributeError, IndexError, ValueError, TypeError) \
+                        as err:
+                    ret[id]["ifIn"+sfx] = None
+                    ret[id]["ifOut"+sfx] = None
+                    ret[id]["error"] = \
+                        "No such instance: ip: %s:%d, id: %s [%s]" \
+                        % (self.addr, self.port, id,
+                           ifs.get(id, {}).get("ifName", ""))
         return ret
 
-    def getall(self, ids, ifs={}, suffix="Octets", n=8, only32bit=False):
+    def getblock(self, request, prefix, ifs, suffix="Octets"):
+        result = self.get(self.block_oids(request, prefix, suffix))
+        if self.last_error == "tooBig" and len(request) > 1:
+            # split request to halves
+            half = len(request)//2
+            ret = self.getblock(request[:half], prefix, ifs, suffix)
+            ret.update(self.getblock(request[half:], prefix, ifs, suffix))
+            return ret
+        return self.parse_block(request, result, ifs, suffix)
+
+    def counter_prefix(self, id, ifs={}, suffix="Octets", only32bit=False):
+        # override to 32bit, if configured
+        if only32bit or ifs.get(id, {}).get("_counter_size", 0) == 32 \
+                or "Octets" not in entries(suffix):
+            return "if"
+        return "ifHC"
+
+    def getblocks(self, ids, ifs={}, suffix="Octets", n=None,
+                  only32bit=False):
+        '''
+        Split ids to request blocks of max n ids with same counter prefix.
+        Block size is learned for each agent, if n is not specified.
+        Each id needs in and out OID for every entry.
+        '''
+        if n is None:
+            n = max(1, self.pdu_size()//(2*len(entries(suffix))))
+        ids = list(ids)
+        request = {"ifHC": [], "if": []}
+        while ids:
+            prefix = self.counter_prefix(ids[0], ifs, suffix, only32bit)
+            request[prefix].append(ids.pop(0))
+            if len(request[prefix]) >= n:
+                yield prefix, request[prefix]
+                request[prefix] = []
+        for prefix in ["ifHC", "if"]:
+            if request[prefix]:
+                yield prefix, request[prefix]
+
+    def getall(self, ids, ifs={}, suffix="Octets", n=None, only32bit=False,
+               bulk=False, max_repetitions=None):
         ret = {}
-        if ids:
-            request = {"ifHC": [], "if": []}
-            while ids:
-                # override to 32bit, if configured
-                if only32bit or ifs.get(ids[0], {}).get("_counter_size", 0) == 32 \
-                        or suffix!="Octets":
-                    prefix = "if"
-                else:
-                    prefix = "ifHC"
-                request[prefix].append(ids.pop(0))
-                if len(request[prefix]) >= n:
-                    ret.update(
-                        self.getblock(request[prefix], prefix, ifs, suffix=suffix)
-                    )
-                    request[prefix] = []
-            for prefix in ["ifHC", "if"]:
-                if request[prefix]:
-                    ret.update(
-                        self.getblock(request[prefix], prefix, ifs, suffix=suffix)
-                    )
+        if bulk:
+            ids, bulk_ids = self.split_bulk(ids, ifs, suffix, only32bit)
+            if bulk_ids:
+                prefix = self.counter_prefix(
+                    bulk_ids[0], ifs, suffix, only32bit)
+                columns = self.counter_columns(prefix, suffix)
+                ret.update(self.parse_columns(
+                    bulk_ids,
+                    self.getcolumns(columns, bulk_ids, max_repetitions),
+                    ifs, suffix
+                ))
+        for prefix, request in self.getblocks(ids, ifs, suffix, n, only32bit):
+            ret.update(
+                self.getblock(request, prefix, ifs, suffix=suffix)
+            )
         return ret
 
-    def getsome(self, prefix="", suffixes=[], ids=[]):
+    def split_bulk(self, ids, ifs={}, suffix="Octets", only32bit=False):
+        '''
+        Split ids to ids for GET requests and ids retrieved by GETBULK.
+        32bit counters are retrieved by GET, if 64bit counters are used.
+        '''
+        if only32bit or "Octets" not in entries(suffix):
+            return [], [x for x in ids if str(x).isdigit()]
+        bulk_ids = [
+            x for x in ids
+            if str(x).isdigit() and self.counter_prefix(x, ifs) == "ifHC"
+        ]
+        return [x for x in ids if x not in bulk_ids], bulk_ids
+
+    def bulk_size(self, ids, columns, max_repetitions=None):
+        return max(1, min(
+            len(ids)+1,
+            max_repetitions or self.pdu_size()//len(columns)
+        ))
+
+    def id_ranges(self, ids):
+        '''
+        Split numeric ids to [first, last] ranges of consecutive ids.
+        '''
+        ranges = []
+        for id in sorted(set(int(x) for x in ids)):
+            if ranges and ranges[-1][1] == id-1:
+                ranges[-1][1] = id
+            else:
+                ranges.append([id, id])
+        return ranges
+
+    def getcolumns(self, columns, ids, max_repetitions=None):
+        '''
+        Retrieve table columns for numeric ids by GETBULK requests.
+        Each range of consecutive ids is walked separately.
+        Return dict of {index: [column values]}.
+        '''
+        values = {}
+        for first, last in self.id_ranges(ids):
+            repetitions = self.bulk_size(
+                range(first, last+1), columns, max_repetitions)
+            oids = [self.oid("", x, first-1) for x in columns]
+            while oids:
+                vars = self.getbulk(oids, repetitions)
+                if self.last_error == "tooBig" and repetitions > 1:
+                    repetitions //= 2
+                    continue
+                oids = self.parse_bulk(columns, vars, values, last)
+        return values
+
+    def parse_bulk(self, columns, vars, values, last_id):
+        '''
+        Store column values from GETBULK response. Return OIDs for next
+        request or None, when end of column or last id was reached.
+        '''
+        prefixes = [OID_TABLE[x]+"." for x in columns]
+        count = len(columns)
+        oids = None
+        for row in self.data_rows(list(vars), count):
+            if len(row) < count:
+                return None
+            oids = []
+            for column, (var, prefix) in enumerate(zip(row, prefixes)):
+                oid = self.var_oid(var)
+                if var.val is None or not oid.startswith(prefix):
+                    return None  # end of column
+                index = int(oid[len(prefix):].split(".")[0])
+                values.setdefault(index, [None]*count)[column] = var.val
+                oids.append("." + oid)
+            if min([int(x.rsplit(".", 1)[-1]) for x in oids]) >= last_id:
+                return None
+        return oids
+
+    def parse_columns(self, ids, values, ifs, suffix="Octets"):
+        result = []
+        for id in ids:
+            result.extend(values.get(int(id), [None]*2*len(entries(suffix))))
+        return self.parse_block(ids, result, ifs, suffix)
+
+    def some_oids(self, prefix="", suffixes=[], ids=[]):
         mibvars = []
         if ids:
             for id in ids:
@@ -690,9 +1043,492 @@ class SNMP:
                 self.oid(prefix, str(suffix))
                 for suffix in suffixes
             ])
-        vars = self.varlist(*mibvars)
-        varbinds = self.session.get(vars)
-        return [x.val for x in vars]
+        return mibvars
+
+    def getsome(self, prefix="", suffixes=[], ids=[]):
+        return self.getmany(self.some_oids(prefix, suffixes, ids))
+
+
+# Pure python SNMP v2c client, used by asyncio engine.
+
+BER_INTEGER = 0x02
+BER_OCTET_STRING = 0x04
+BER_NULL = 0x05
+BER_OID = 0x06
+BER_SEQUENCE = 0x30
+BER_IPADDRESS = 0x40
+BER_UNSIGNED = (0x41, 0x42, 0x43, 0x46)  # Counter32, Gauge32, TimeTicks, Counter64
+SNMP_GET = 0xa0
+SNMP_GETNEXT = 0xa1
+SNMP_RESPONSE = 0xa2
+SNMP_GETBULK = 0xa5
+SNMP_END_OF_MIB = 0x82
+# NULL, noSuchObject, noSuchInstance, endOfMibView
+SNMP_NO_VALUE = (BER_NULL, 0x80, 0x81, SNMP_END_OF_MIB)
+SNMP_ERRORS = {
+    1: "tooBig", 2: "noSuchName", 3: "badValue", 4: "readOnly", 5: "genErr"
+}
+OID_NAMES = dict((oid, name) for name, oid in OID_TABLE.items())
+
+
+def ber_encode(tag, data):
+    length = len(data)
+    if length < 0x80:
+        return bytes([tag, length]) + data
+    size = length.to_bytes((length.bit_length()+7)//8, "big")
+    return bytes([tag, 0x80 | len(size)]) + size + data
+
+
+def ber_integer(value):
+    return ber_encode(
+        BER_INTEGER, value.to_bytes(value.bit_length()//8+1, "big", signed=True)
+    )
+
+
+def ber_oid(oid):
+    ids = [int(x) for x in oid.strip(".").split(".")]
+    data = bytearray([ids[0]*40+ids[1]])
+    for id in ids[2:]:
+        chunk = [id & 0x7f]
+        id >>= 7
+        while id:
+            chunk.insert(0, 0x80 | (id & 0x7f))
+            id >>= 7
+        data.extend(chunk)
+    return ber_encode(BER_OID, bytes(data))
+
+
+def ber_decode(data, pos=0):
+    '''
+    Decode one BER item, return tag, value and position of next item.
+    '''
+    tag = data[pos]
+    length = data[pos+1]
+    pos += 2
+    if length & 0x80:
+        size = length & 0x7f
+        length = int.from_bytes(data[pos:pos+size], "big")
+        pos += size
+    if pos+length > len(data):
+        raise ValueError("Truncated BER data")
+    return tag, data[pos:pos+length], pos+length
+
+
+def ber_items(data):
+    pos = 0
+    while pos < len(data):
+        tag, value, pos = ber_decode(data, pos)
+        yield tag, value
+
+
+def ber_decode_oid(data):
+    ids = [data[0]//40, data[0] % 40]
+    id = 0
+    for byte in data[1:]:
+        id = (id << 7) | (byte & 0x7f)
+        if not byte & 0x80:
+            ids.append(id)
+            id = 0
+    return ".".join([str(x) for x in ids])
+
+
+def snmp_value(tag, data):
+    '''
+    Convert BER value to string, same as netsnmp does.
+    '''
+    if tag in SNMP_NO_VALUE:
+        return None
+    if tag == BER_INTEGER:
+        return str(int.from_bytes(data, "big", signed=True))
+    if tag in BER_UNSIGNED:
+        return str(int.from_bytes(data, "big"))
+    if tag == BER_OID:
+        return "." + ber_decode_oid(data)
+    if tag == BER_IPADDRESS:
+        return ".".join([str(x) for x in data])
+    # one character for each byte, binary values like MAC addresses
+    # must not be decoded as utf8
+    return data.decode("latin1")
+
+
+def snmp_message(community, pdu_type, request_id, oids, a=0, b=0):
+    '''
+    Encode SNMP v2c request. For GETBULK a and b are non-repeaters
+    and max-repetitions, error status and index for other requests.
+    '''
+    varbinds = b"".join([
+        ber_encode(BER_SEQUENCE, ber_oid(oid)+ber_encode(BER_NULL, b""))
+        for oid in oids
+    ])
+    pdu = ber_encode(
+        pdu_type,
+        ber_integer(request_id) + ber_integer(a) + ber_integer(b)
+        + ber_encode(BER_SEQUENCE, varbinds)
+    )
+    return ber_encode(
+        BER_SEQUENCE,
+        ber_integer(1) + ber_encode(BER_OCTET_STRING, community) + pdu
+    )
+
+
+def snmp_response(data):
+    '''
+    Decode SNMP response, return request id, error status, error index
+    and list of varbinds (oid, tag, value).
+    '''
+    tag, message, pos = ber_decode(data)
+    version, community, (pdu_type, pdu) = list(ber_items(message))
+    if pdu_type != SNMP_RESPONSE:
+        raise ValueError("Not a SNMP response")
+    fields = list(ber_items(pdu))
+    request_id, error_status, error_index = [
+        int.from_bytes(value, "big", signed=True)
+        for tag, value in fields[:3]
+    ]
+    varbinds = []
+    for tag, varbind in ber_items(fields[3][1]):
+        (oid_tag, oid), (tag, value) = list(ber_items(varbind))
+        varbinds.append((ber_decode_oid(oid), tag, value))
+    return request_id, error_status, error_index, varbinds
+
+
+class snmp_var:
+    '''
+    Variable binding compatible with netsnmp.Varbind.
+    '''
+
+    def __init__(self, oid, tag, value):
+        self.tag, self.iid = "." + oid, ""
+        ids = oid.split(".")
+        for pos in range(len(ids)-1, 0, -1):
+            name = OID_NAMES.get(".".join(ids[:pos]))
+            if name:
+                self.tag, self.iid = name, ".".join(ids[pos:])
+                break
+        self.type = tag
+        self.val = snmp_value(tag, value)
+
+
+class snmp_protocol:
+    '''
+    Datagram protocol, dispatch responses to waiting requests.
+    '''
+
+    def __init__(self):
+        self.transport = None
+        self.requests = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            response = snmp_response(data)
+        except (ValueError, IndexError):
+            return  # ignore broken packets
+        future = self.requests.pop(response[0], None)
+        if future is not None and not future.done():
+            future.set_result(response)
+
+    def error_received(self, exc):
+        pass  # ICMP errors, request will time out
+
+    def connection_lost(self, exc):
+        pass
+
+
+class SNMPAsync(SNMP):
+    '''
+    SNMP client with asyncio UDP transport, does not require netsnmp.
+    Coroutines (aget*) can be used to poll many agents at once.
+    '''
+    timeout = 2.0
+    retries = 2
+    max_inflight = 8  # concurrent requests per agent
+
+    def connect(self, addr, community_name):
+        self.community = community_name.encode("utf8")
+        self.protocol = None
+        self.protocol_loop = None
+        self.loop = None
+        self.request_id = random.randint(1, 2**30)
+
+    async def connection(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if self.protocol_loop is not loop:
+            self.close_transport()
+            self.inflight = asyncio.Semaphore(self.max_inflight)
+            transport, self.protocol = await loop.create_datagram_endpoint(
+                snmp_protocol, remote_addr=(self.addr, self.port)
+            )
+            self.protocol_loop = loop
+        return self.protocol
+
+    def close_transport(self):
+        if self.protocol is not None and self.protocol.transport:
+            try:
+                self.protocol.transport.close()
+            except RuntimeError:
+                # loop of transport is closed, close socket directly
+                sock = self.protocol.transport.get_extra_info("socket")
+                if sock is not None:
+                    sock.close()
+        self.protocol = self.protocol_loop = None
+
+    def close(self):
+        '''
+        Close UDP socket and own event loop of blocking interface.
+        '''
+        import asyncio
+        self.close_transport()
+        if self.loop is not None:
+            # let transport finish closing
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.loop.close()
+            self.loop = None
+
+    async def request(self, pdu_type, oids, a=0, b=0):
+        '''
+        Send request, return error and list of varbinds (None on error).
+        Error is also stored in last_error for blocking interface.
+        '''
+        import asyncio
+        protocol = await self.connection()
+        size = len(oids)
+        if pdu_type == SNMP_GETBULK:
+            size *= b
+        async with self.inflight:
+            start = time.time()
+            error, varbinds = "timeout", None
+            for retry in range(self.retries+1):
+                self.request_id = self.request_id % 2**31 + 1
+                request_id = self.request_id
+                future = asyncio.get_running_loop().create_future()
+                protocol.requests[request_id] = future
+                self.requests += 1
+                protocol.transport.sendto(snmp_message(
+                    self.community, pdu_type, request_id, oids, a, b
+                ))
+                try:
+                    response = await asyncio.wait_for(future, self.timeout)
+                except asyncio.TimeoutError:
+                    protocol.requests.pop(request_id, None)
+                    continue
+                if response[1]:
+                    error = SNMP_ERRORS.get(response[1], str(response[1]))
+                else:
+                    error, varbinds = None, response[3]
+                break
+            self.last_error = error
+            self.sizer.update(self.agent(), size, time.time()-start, error)
+        return error, varbinds
+
+    def values(self, oids, varbinds):
+        if varbinds is None:
+            return [None]*len(oids)
+        return [snmp_value(tag, value) for oid, tag, value in varbinds]
+
+    async def aget(self, oids, pdu_type=SNMP_GET):
+        error, varbinds = await self.request(pdu_type, oids)
+        return self.values(oids, varbinds)
+
+    async def agetmany(self, oids):
+        ret = []
+        oids = list(oids)
+        size = self.pdu_size()
+        while oids:
+            error, varbinds = await self.request(SNMP_GET, oids[:size])
+            if error == "tooBig":
+                if size > 1:
+                    size //= 2  # retry with smaller PDU
+                    continue
+                varbinds = None  # give up on this OID
+            ret.extend(self.values(oids[:size], varbinds))
+            oids = oids[size:]
+        return ret
+
+    async def agetblock(self, request, prefix, ifs, suffix="Octets"):
+        oids = self.block_oids(request, prefix, suffix)
+        error, varbinds = await self.request(SNMP_GET, oids)
+        if error == "tooBig" and len(request) > 1:
+            half = len(request)//2
+            ret = await self.agetblock(request[:half], prefix, ifs, suffix)
+            ret.update(
+                await self.agetblock(request[half:], prefix, ifs, suffix))
+            return ret
+        return self.parse_block(
+            request, self.values(oids, varbinds), ifs, suffix)
+
+    async def agetnext(self, oids):
+        return await self.aget(oids, SNMP_GETNEXT)
+
+    async def agetbulk(self, oids, max_repetitions):
+        error, varbinds = await self.request(
+            SNMP_GETBULK, oids, 0, max_repetitions)
+        return [snmp_var(*x) for x in varbinds or []]
+
+    async def agetrange(self, columns, first, last, values,
+                        max_repetitions=None):
+        repetitions = self.bulk_size(
+            range(first, last+1), columns, max_repetitions)
+        oids = [self.oid("", x, first-1) for x in columns]
+        while oids:
+            error, varbinds = await self.request(
+                SNMP_GETBULK, oids, 0, repetitions)
+            if error == "tooBig" and repetitions > 1:
+                repetitions //= 2
+                continue
+            oids = self.parse_bulk(
+                columns, [snmp_var(*x) for x in varbinds or []],
+                values, last
+            )
+
+    async def agetcolumns(self, columns, ids, max_repetitions=None):
+        import asyncio
+        values = {}
+        await asyncio.gather(*[
+            self.agetrange(columns, first, last, values, max_repetitions)
+            for first, last in self.id_ranges(ids)
+        ])
+        return values
+
+    async def awalk(self, oids):
+        columns = [oid.strip(".") for oid in oids]
+        current = list(columns)
+        count = len(columns)
+        max_repetitions = self.max_repetitions
+        vars = []
+        while True:
+            error, varbinds = await self.request(
+                SNMP_GETBULK, current, 0, max_repetitions)
+            if error == "tooBig" and max_repetitions > 1:
+                max_repetitions //= 2
+                continue
+            if not varbinds:
+                return vars
+            for pos in range(0, len(varbinds)-count+1, count):
+                row = varbinds[pos:pos+count]
+                for (oid, tag, value), column in zip(row, columns):
+                    if tag == SNMP_END_OF_MIB \
+                            or not oid.startswith(column+"."):
+                        return vars
+                vars.extend([snmp_var(*x) for x in row])
+                current = [oid for oid, tag, value in row]
+
+    async def aget_uptime(self):
+        return self.parse_uptime(
+            await self.agetnext([self.oid('', 'sysUpTime')]))
+
+    async def agetsome(self, prefix="", suffixes=[], ids=[]):
+        return await self.agetmany(self.some_oids(prefix, suffixes, ids))
+
+    async def aget_data(self, prefix, oids):
+        vars = await self.awalk([
+            self.oid(prefix, x)
+            for x in oids
+        ])
+        return self.data_rows(vars, len(oids))
+
+    async def agetall(self, ids, ifs={}, suffix="Octets", n=None,
+                      only32bit=False, bulk=False, max_repetitions=None):
+        import asyncio
+        ret = {}
+        bulk_ids = None
+        if bulk:
+            ids, bulk_ids = self.split_bulk(ids, ifs, suffix, only32bit)
+        tasks = [
+            self.agetblock(request, prefix, ifs, suffix)
+            for prefix, request
+            in self.getblocks(ids, ifs, suffix, n, only32bit)
+        ]
+        if bulk_ids:
+            prefix = self.counter_prefix(
+                bulk_ids[0], ifs, suffix, only32bit)
+            # columns are walked concurrently with GET blocks
+            tasks.append(self.agetcolumns(
+                self.counter_columns(prefix, suffix),
+                bulk_ids, max_repetitions
+            ))
+        results = await asyncio.gather(*tasks)
+        if bulk_ids:
+            ret.update(self.parse_columns(
+                bulk_ids, results.pop(), ifs, suffix))
+        for result in results:
+            ret.update(result)
+        return ret
+
+    # blocking interface, same as netsnmp SNMP class
+
+    def run(self, coroutine):
+        import asyncio
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(coroutine)
+
+    def get(self, oids):
+        return self.run(self.aget(oids))
+
+    def getmany(self, oids):
+        return self.run(self.agetmany(oids))
+
+    def getnext(self, oids):
+        return self.run(self.agetnext(oids))
+
+    def walk(self, oids):
+        return self.run(self.awalk(oids))
+
+    def getbulk(self, oids, max_repetitions):
+        return self.run(self.agetbulk(oids, max_repetitions))
+
+
+def snmp_connect(addr, community_name="public", engine=None):
+    engine = engine or SNMP_ENGINE
+    # sessions are bound to event loop, keep them separate for each thread
+    key = (engine, addr, community_name, threading.get_ident())
+    if SNMP_SESSIONS is not None and key in SNMP_SESSIONS:
+        return SNMP_SESSIONS[key]
+    if engine == "asyncio":
+        snmpc = SNMPAsync(addr, community_name)
+    else:
+        snmpc = SNMP(addr, community_name)
+    if SNMP_SESSIONS is not None:
+        SNMP_SESSIONS[key] = snmpc
+    return snmpc
+
+
+def snmp_release(snmpc):
+    '''
+    Close session, which is not kept in SNMP_SESSIONS.
+    '''
+    if SNMP_SESSIONS is None:
+        snmpc.close()
+
+
+def benchmark_snmp(addr, ids, community_name="public", repeat=10):
+    '''
+    Compare netsnmp and asyncio engines polling the same interfaces.
+    '''
+    for engine in [SNMP, SNMPAsync]:
+        try:
+            snmpc = engine(addr, community_name)
+        except ImportError as err:
+            print("%-10s skipped: %s" % (engine.__name__, err))
+            continue
+        if not ids:
+            ids = list(snmpc.get_key_value("ifIndex").values())
+        snmpc.requests = 0
+        start = time.time()
+        for i in range(repeat):
+            errors = len([
+                x for x in snmpc.getall(ids, bulk=SNMP_BULK).values()
+                if x['error']
+            ])
+        elapsed = time.time()-start
+        print("%-10s %d interfaces, %d polls, %d requests, %d errors, "
+              "%.3fs, %.1f ms/poll"
+              % (engine.__name__, len(ids), repeat, snmpc.requests, errors,
+                 elapsed, elapsed*1000/repeat))
 
 
 class grouper(dict):
@@ -747,15 +1583,146 @@ class grouper(dict):
             self[st].append(deltas[t])
         return self
 
+    def stream(self, rows, start=None, fx=['avg', 'avg', max, max]):
+        '''
+        Aggregate (time, values) rows sorted by time in descending order.
+        Same as load() and items(), but yields one group at a time.
+        Group keys never increase, so only one group is kept in memory.
+        '''
+        intervals = list(self.compress_intervals.items())
+        limit = None
+        key = None
+        for t, values in rows:
+            if start is None:
+                start = t
+            if limit is None or start-t >= limit:
+                if intervals:
+                    limit, range = intervals.pop(0)
+                else:
+                    break
+            st = int(t/range)*range
+            if st != key:
+                if key is not None and acc is not None:
+                    yield key, self.result(acc, fx)
+                key = st
+                acc = [[0, 0] if func == "avg" else [None, 0] for func in fx]
+            if acc is None:
+                continue
+            if len(values) < len(fx):
+                print("Wrong data from log file")
+                acc = None  # ignore whole group
+                continue
+            for a, func, x in zip(acc, fx, values):
+                if x is None:
+                    continue
+                if func == "avg":
+                    a[0] += x
+                elif a[1]:
+                    a[0] = func([a[0], x])
+                else:
+                    a[0] = x
+                a[1] += 1
+        if key is not None and acc is not None:
+            yield key, self.result(acc, fx)
+
+    def result(self, acc, fx):
+        vals = []
+        for (value, count), func in zip(acc, fx):
+            if not count:
+                vals.append(None)
+            elif func == "avg":
+                vals.append(value/count)  # avg
+            else:
+                vals.append(value)
+        return vals
+
+    def tier(self, age):
+        '''
+        Return compress interval (limit, range) for data of given age
+        or None if data is too old.
+        '''
+        for limit, range in sorted(self.compress_intervals.items()):
+            if age < limit:
+                return limit, range
+        return None
+
+    def load_aged(self, deltas, start):
+        '''
+        Load deltas into groups by their age relative to start.
+        '''
+        for t in deltas:
+            tier = self.tier(start-t)
+            if tier:
+                self[int(t/tier[1])*tier[1]].append(deltas[t])
+        return self
+
+
+def compact_slot(filename, now=None):
+    '''
+    Time of most recent daily compression slot of file. Each file has
+    stable slot in the day to spread compressions over the day.
+    '''
+    if now is None:
+        now = time.time()
+    instant = now//grouper.one_day*grouper.one_day + \
+        zlib.crc32(filename.encode("utf8")) % grouper.one_day
+    if instant > now:
+        instant -= grouper.one_day
+    return instant
+
+
+def compact_due(filename, last):
+    '''
+    Return True if file last compressed at time last should be compressed
+    now and compression budget of this run is not exhausted.
+    '''
+    if last >= compact_slot(filename):
+        return False
+    if COMPACT_MAX and COMPACT_DONE[0] >= COMPACT_MAX:
+        return False
+    if COMPACT_BUDGET and COMPACT_DONE[1] >= COMPACT_BUDGET:
+        return False
+    return True
+
 
 class LockError(Exception):
     pass
 
 
+class DeadlineError(Exception):
+    pass
+
+
+def deadline_handler(signum, frame):
+    raise DeadlineError("Deadline exceeded")
+
+
+def block_deadline(block=True):
+    '''
+    Delay deadline alarm while writing log files to avoid partial writes.
+    '''
+    if hasattr(signal, "pthread_sigmask"):
+        signal.pthread_sigmask(
+            block and signal.SIG_BLOCK or signal.SIG_UNBLOCK,
+            [signal.SIGALRM]
+        )
+
+
 class logfile:
     header_format = "%010d %020d %020d\n"
     header_length = len(header_format % (0, 0, 0))
     data_format = "%d %d %d %d %d\n"
+    incremental = False
+    full_compact = False
+    indexed = True  # text rows, sidecar index can be used
+    index_step = 256  # rows per index entry
+    index_struct = struct.Struct("<qq")
+    sum_struct = struct.Struct("<qdd")  # time, cumulative in, out
+    day_header = struct.Struct("<q")  # time of last row
+    day_struct = struct.Struct("<qdddd")  # day, bytes in, out, max in, out
+    rollups = None  # {name: step} of rollup files
+    rollup_rows = ROLLUP_ROWS
+    merge_f = None  # logfile merged on full compression
 
     def __init__(self, filename, force_compress=False):
         self.filename = filename
@@ -772,9 +1739,9 @@ class logfile:
                         self.data_type(counter_split[1]),
                         self.data_type(counter_split[2])
                     )
-                    if self.counter[0]//grouper.one_day != time.time()//grouper.one_day:
-                        # next day, force compress
-                        force_compress = True
+                    if compact_due(self.filename, self.first_row_time()):
+                        # compress incrementally
+                        self.incremental = True
                 else:
                     bkp_filename = filename + \
                         time.strftime(".backup-%Y%m%d-%H%M%S")
@@ -783,6 +1750,7 @@ class logfile:
                     os.rename(filename, bkp_filename)
                     self.f = self.open(self.filename, "wb")
                     self.counter = ()
+                    return  # new empty file, nothing to convert
             else:
                 self.counter = ()
             if len(counter) != self.header_length:
@@ -791,7 +1759,7 @@ class logfile:
                 self.load(self.f)
             elif force_compress:
                 #print("Compress:", self.filename)
-                self.load(self.f)
+                self.full_compact = True
         except IOError:
             self.f = self.open(self.filename, "wb")
             self.counter = ()
@@ -846,14 +1814,48 @@ class logfile:
     def header(self):
         return (self.header_format % self.counter).encode("utf8")
 
+    def first_row_time(self):
+        '''
+        Time of first data row, which is time of last compression.
+        '''
+        pos = self.f.tell()
+        row = self.f.readline()
+        self.f.seek(pos)
+        if not row.strip():
+            return time.time()  # no data
+        try:
+            return long(row.split(b" ", 1)[0])
+        except ValueError:
+            return 0
+
     def save(self, delta=None):
+        block_deadline()
+        start = time.time()
+        compress = self.deltas or self.incremental or self.full_compact \
+            or getattr(self, "export_due", False)
+        try:
+            self.write(delta)
+            if self.rollups:
+                self.write_rollups(None if compress else delta)
+            self.write_sum(delta, compress)
+            self.write_summary(delta, compress)
+        finally:
+            block_deadline(False)
+            if self.deltas or self.incremental or self.full_compact:
+                COMPACT_DONE[0] += 1
+                COMPACT_DONE[1] += time.time()-start
+
+    def write(self, delta=None):
+        # delta can be one row or list of rows
+        rows = delta if isinstance(delta, list) else [delta]
         if self.deltas:
             # save data when converting to new format
             #print("Full save:", self.filename)
             # rename old file, do not close it to leave it locked
             old_f = self.f
-            if delta is not None:
-                self.deltas[delta[0]] = delta[1:]  # add current values
+            for delta in rows:
+                if delta is not None:
+                    self.deltas[delta[0]] = delta[1:]  # add current values
             self.compress()
             self.f = self.open(self.filename+'.tmp', "wb")
             if self.header_format:
@@ -866,6 +1868,9 @@ class logfile:
             if BACKUP:
                 os.rename(self.filename, self.filename+"~")
             os.rename(self.filename+'.tmp', self.filename)
+            if self.indexed:
+                self.write_index()
+            self.precompress()
             old_f.close()  # close old file after rename
         else:
             # Avoid change length of header here.
@@ -876,194 +1881,2187 @@ class logfile:
                     self.f.seek(0)
                     self.f.write(header)
             self.f.seek(0, 2)  # EOF
-            self.f.write((self.data_format % delta).encode("utf8"))
+            size = self.f.tell()
+            data = b"".join(
+                (self.data_format % delta).encode("utf8")
+                for delta in rows if delta is not None
+            )
+            self.f.write(data)
+            if self.full_compact:
+                self.compact(full=True)
+            elif self.incremental:
+                self.compact()
+            else:
+                self.f.flush()
+                self.precompress(data, size)
+                self.f.close()
+
+    def row_time(self, data, pos):
+        return long(data[pos:data.find(b" ", pos)])
+
+    def bisect_rows(self, data, lo, hi, pred):
+        '''
+        Return offset of first row between lo and hi for which pred(time)
+        is true. Predicate must be false for first rows and true for rest.
+        '''
+        while lo < hi:
+            mid = data.rfind(b"\n", lo, (lo+hi)//2) + 1 or lo
+            if pred(self.row_time(data, mid)):
+                hi = mid
+            else:
+                lo = data.find(b"\n", mid, hi) + 1 or hi
+        return lo
+
+    def iter_rows(self, data, lo, hi):
+        '''
+        Iterate over (time, values) rows between lo and hi offsets.
+        '''
+        max_time = time.time() + 3600*24  # anything beyond 1 day from now
+        while lo < hi:
+            pos = data.find(b"\n", lo, hi)
+            if pos < 0:
+                pos = hi
+            row_split = data[lo:pos].split(b" ", 4)
+            lo = pos + 1
+            try:
+                t = long(row_split[0])
+                if t > max_time:
+                    print("Time from future ignored: %s: %d" %
+                          (self.filename, t))
+                    continue
+                yield t, tuple(self.data_type(x) for x in row_split[1:])
+            except ValueError as err:
+                print("Error loading logfile: %s" % err)
+
+    def parse_rows(self, data):
+        deltas = {}
+        for row in data.split(b"\n"):
+            if row:
+                row_split = row.split(b" ", 4)
+                deltas[long(row_split[0])] = tuple(
+                    self.data_type(x) for x in row_split[1:])
+        return deltas
+
+    def desc_rows(self, data, size):
+        '''
+        Iterate over all (time, values) rows of mmapped logfile data
+        in descending order.
+        '''
+        h = self.header_length
+        if size <= h:
+            return iter(())
+        last = self.row_time(data, h)
+        # appended rows (newer than last compression)
+        end = self.bisect_rows(data, h, size, lambda t: t > last)
+        appended = self.parse_rows(data[end:])
+        return itertools.chain(sorted(appended.items(), reverse=True),
+                               self.iter_rows(data, h, end))
+
+    def compact(self, full=False):
+        '''
+        Incremental compression. Rows are stored in descending order since
+        last full save and appended rows follow in ascending order. Only
+        rows which crossed a compress interval limit since last compression
+        (time of first row) are regrouped, other rows are copied.
+        Full compression streams all rows through grouper.stream(),
+        rows of merged logfile are merged into this stream.
+        '''
+        start = self.counter[0]
+        h = self.header_length
+        self.f.flush()
+        size = os.fstat(self.f.fileno()).st_size
+        if size <= h and not (full and self.merge_f):
             self.f.close()
+            return
+        data = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        if full:
+            f = self.open(self.filename+'.tmp', "wb")
+            f.write(self.header())
+            rows = self.desc_rows(data, size)
+            if self.merge_f:
+                merge_data = mmap.mmap(self.merge_f.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+                rows = merge_rows(self.desc_rows(
+                    merge_data, merge_data.size()), rows)
+            for t, vals in grouper().stream(rows, start):
+                f.write((self.data_format % tuple(
+                    [t]+[self.store_value(x) for x in vals])).encode("utf8"))
+            if self.merge_f:
+                merge_data.close()
+                self.merge_f.close()
+                self.merge_f = None
+            return self.replace(f, data)
+        last = self.row_time(data, h)
+        # appended rows (newer than last compression)
+        end = self.bisect_rows(data, h, size, lambda t: t > last)
+        appended = self.parse_rows(data[end:])
+        # time windows to regroup, aligned to start of group
+        grp = grouper()
+        windows = [(last, start)] + [
+            (last-limit, start-limit)
+            for limit in sorted(grp.compress_intervals)[:-1]
+        ]
+        aligned = []
+        for lo, hi in windows:
+            tier = grp.tier(start-lo)
+            if tier:
+                lo = int(lo/tier[1])*tier[1]
+            aligned.append([lo, hi])
+        aligned.sort(reverse=True)
+        windows = [aligned[0]]
+        for lo, hi in aligned[1:]:
+            if hi >= windows[-1][0]:
+                windows[-1][0] = min(lo, windows[-1][0])
+            else:
+                windows.append([lo, hi])
+        out = [self.header()]
+        pos = h
+        for lo, hi in windows:
+            a = self.bisect_rows(data, pos, end, lambda t: t <= hi)
+            b = self.bisect_rows(data, a, end, lambda t: t < lo)
+            out.append(data[pos:a])
+            deltas = self.parse_rows(data[a:b])
+            deltas.update(dict(
+                (t, v) for t, v in appended.items() if lo <= t <= hi))
+            for t, vals in sorted(grouper().load_aged(deltas, start).items(),
+                                  reverse=True):
+                out.append((self.data_format % tuple(
+                    [t]+[self.store_value(x) for x in vals])).encode("utf8"))
+            pos = b
+        # remove too old rows
+        limit = start - max(grp.compress_intervals)
+        out.append(data[pos:self.bisect_rows(data, pos, end,
+                                             lambda t: t < limit)])
+        f = self.open(self.filename+'.tmp', "wb")
+        f.write(b"".join(out))
+        self.replace(f, data)
+
+    def replace(self, f, data):
+        '''
+        Replace logfile with new file f, close mmapped data of old file.
+        '''
+        f.close()
+        data.close()
+        if BACKUP:
+            os.rename(self.filename, self.filename+"~")
+        os.rename(self.filename+'.tmp', self.filename)
+        self.write_index()
+        self.precompress()
+        self.f.close()  # close old file after rename
+
+    def rollup_name(self, name):
+        return "%s.%s.log" % (os.path.splitext(self.filename)[0], name)
+
+    def write_rollups(self, delta=None):
+        '''
+        Update rollup files or regenerate them from logfile after
+        compression. Rollup file has same format as logfile, but contains
+        only rollup_rows rows grouped by fixed step in ascending order.
+        New rows are folded into last group, so only end of rollup file
+        is rewritten. Folded averages are exact up to rounding of stored
+        values, until rollups are regenerated.
+        '''
+        if delta is not None:
+            rows = [row for row in
+                    (delta if isinstance(delta, list) else [delta])
+                    if row is not None]
+            if not rows:
+                return
+            if all(os.path.exists(self.rollup_name(name))
+                   for name in self.rollups):
+                reader = logfile.__new__(logfile)
+                reader.filename = self.filename
+                reader.f = open(self.filename, "rb")
+                try:
+                    for name, step in self.rollups.items():
+                        self.fold_rollup(name, step, rows, reader)
+                finally:
+                    reader.f.close()
+                return
+        # only rows covered by longest rollup are read
+        reader = logfile.__new__(logfile)
+        reader.filename = self.filename
+        reader.f = open(self.filename, "rb")
+        try:
+            header = reader.f.readline()
+            rows = reader.read_range(
+                self.counter[0] - max(self.rollups.values())*self.rollup_rows,
+                time.time() + 3600*24)
+        finally:
+            reader.f.close()
+        rows.reverse()
+        for name, step in self.rollups.items():
+            grp = grouper()
+            grp.compress_intervals = {step*self.rollup_rows: step}
+            groups = list(itertools.islice(
+                grp.stream(rows, self.counter[0]), self.rollup_rows))
+            f = self.open(self.rollup_name(name)+".tmp", "wb")
+            f.write(header)
+            for t, vals in reversed(groups):
+                f.write((self.data_format % tuple(
+                    [t]+[self.store_value(x) for x in vals])).encode("utf8"))
+            f.close()
+            os.rename(self.rollup_name(name)+".tmp", self.rollup_name(name))
+
+    def fold_rollup(self, name, step, rows, reader):
+        '''
+        Fold rows sorted by time into last group of rollup file. Number
+        of rows already in last group is counted in logfile by reader.
+        Rollup file is rewritten only if it exceeds rollup_rows or is not
+        ascending, otherwise last group is replaced in place.
+        '''
+        f = self.open(self.rollup_name(name), "rb+")
+        try:
+            data = f.read()
+            h = data.find(b"\n")+1
+            cut = pos = len(data)
+            if pos > h:
+                pos = data.rfind(b"\n", h, pos-1)+1 or h
+                # rows of older groups are already grouped
+                rows = [row for row in rows
+                        if row[0] >= self.row_time(data, pos)]
+                if not rows:
+                    return
+            key = int(rows[0][0]/step)*step
+            groups = []
+            if pos < cut and self.row_time(data, pos) == key:
+                # last group continues, only if rollup is ascending
+                if self.row_time(data, h) <= key:
+                    vals = [self.data_type(x) for x in
+                            data[pos:].split()[1:]]
+                    groups.append([key, vals, reader.count_range(
+                        key, rows[0][0]-1)])
+                cut = pos
+            for row in rows:
+                t = int(row[0]/step)*step
+                if not groups or groups[-1][0] != t:
+                    groups.append([t, list(row[1:]), 1])
+                    continue
+                vals, count = groups[-1][1:]
+                for i, x in enumerate(row[1:]):
+                    if x is None:
+                        continue
+                    elif vals[i] is None:
+                        vals[i] = x
+                    elif i < 2:
+                        vals[i] = (vals[i]*count+x)/(count+1)  # avg
+                    else:
+                        vals[i] = max(vals[i], x)
+                groups[-1][2] += 1
+            out = b"".join(
+                (self.data_format % tuple(
+                    [t]+[self.store_value(x) for x in vals])).encode("utf8")
+                for t, vals, count in groups)
+            if data.count(b"\n", h, cut)+len(groups) <= self.rollup_rows \
+                    and (cut == h or self.row_time(data, h) <= key):
+                f.seek(0)
+                f.write(self.header())
+                f.seek(cut)
+                f.write(out)
+                f.truncate()
+                return
+            # drop oldest rows
+            old = dict((self.row_time(row, 0), row)
+                       for row in data[h:].splitlines(True)
+                       if row.strip() and self.row_time(row, 0) < key)
+            drop = max(len(old)+len(groups)-self.rollup_rows, 0)
+            replace_file(self.rollup_name(name), b"".join(
+                [self.header()] + [old[t] for t in sorted(old)[drop:]]
+                + [out]))
+        finally:
+            f.close()
+
+    def index_name(self):
+        return os.path.splitext(self.filename)[0]+".idx"
+
+    def precompress(self, data=None, size=None):
+        '''
+        Update gzip sidecar after save, while logfile is locked.
+        Data appended to logfile of given previous size are added to gzip
+        sidecar as new member, if sidecar matches this size. Otherwise
+        sidecar is regenerated. Brotli can't be appended, brotli sidecar
+        is written only by --precompress and removed here as outdated.
+        '''
+        if os.path.exists(self.filename+".br"):
+            os.remove(self.filename+".br")
+        if "gz" not in PRECOMPRESS and \
+                not os.path.exists(self.filename+".gz"):
+            return
+        if data is not None and self.header_format and \
+                append_gzip(self.filename+".gz", self.header(), data, size):
+            return
+        precompress(self.filename, ["gz"])
 
-    def update(self, data_in, data_out,
-               gauge_in=False, gauge_out=False,
-               uptime=None, counter_bits=None):
+    def write_index(self):
         '''
-        Update with current values
+        Write sidecar index of text logfile: first row time and end of
+        descending rows followed by (time, offset) of each index_step row.
+        Appended rows are after end of descending rows, so index stays
+        valid until next full save or compression.
         '''
-        # t = long(time.mktime(time.gmtime())) # UTC time
-        t = long(time.time())  # Local time
-        delta_t = 1
-        delta_in = 0
-        delta_out = 0
-        if self.counter:
-            delta_t = t - self.counter[0]
-            if delta_t == 0:
-                # ignore, no delta time, avoid division by zero
+        idx_name = self.index_name()
+        if not LOG_INDEX and not os.path.exists(idx_name):
+            return
+        h = logfile.header_length
+        with open(self.filename, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= h:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            last = self.row_time(data, h)
+            end = self.bisect_rows(data, h, size, lambda t: t > last)
+            entries = [self.index_struct.pack(last, end)]
+            pos, n = h, 0
+            while pos < end:
+                if n % self.index_step == 0:
+                    entries.append(self.index_struct.pack(
+                        self.row_time(data, pos), pos))
+                pos = data.find(b"\n", pos, end) + 1 or end
+                n += 1
+            data.close()
+        with open(idx_name+".tmp", "wb") as f:
+            f.write(b"".join(entries))
+        os.rename(idx_name+".tmp", idx_name)
+
+    def sum_name(self):
+        return os.path.splitext(self.filename)[0]+".sum"
+
+    def write_sum(self, delta=None, compress=False):
+        '''
+        Append cumulative transferred bytes of rows to sidecar file.
+        Each row adds its rate multiplied by time since previous row.
+        Sidecar is thinned to last entry of each grouper interval after
+        compression, totals are exact only at kept entries and
+        interpolated between them.
+        '''
+        sum_name = self.sum_name()
+        if not os.path.exists(sum_name):
+            if LOG_SUM:
+                build_sum(self.filename)
+            return
+        rows = delta if isinstance(delta, list) else [delta]
+        rows = [row for row in rows if row is not None]
+        size = self.sum_struct.size
+        with open(sum_name, "rb+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if rows:
+                f.seek(0, 2)  # EOF
+                if f.tell() >= size:
+                    f.seek(-size, 2)
+                    last = self.sum_struct.unpack(f.read(size))
+                else:
+                    last = None
+                entries = []
+                for row in sum_rows(rows, last):
+                    entries.append(self.sum_struct.pack(*row))
+                f.write(b"".join(entries))
+            if compress and self.counter:
+                f.seek(0)
+                data = f.read()
+                entries = thin_sum([
+                    self.sum_struct.unpack_from(data, pos)
+                    for pos in range(0, len(data)-size+1, size)
+                ], self.counter[0])
+                replace_file(sum_name, b"".join(
+                    self.sum_struct.pack(*row) for row in entries))
+
+    def summary_name(self):
+        return os.path.splitext(self.filename)[0]+".day"
+
+    def write_summary(self, delta=None, compress=False):
+        '''
+        Update daily summary sidecar (bytes in/out and max in/out of each
+        day) with rows. Days older than last grouper interval are removed
+        after compression.
+        '''
+        summary_name = self.summary_name()
+        if not os.path.exists(summary_name):
+            if LOG_SUM:
+                build_summary(self.filename)
+            return
+        rows = delta if isinstance(delta, list) else [delta]
+        rows = [row for row in rows if row is not None]
+        hs, ds = self.day_header.size, self.day_struct.size
+        with open(summary_name, "rb+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            head = f.read(hs)
+            last = None
+            if len(head) == hs:
+                last = self.day_header.unpack(head)[0] or None
+            count = max(os.fstat(f.fileno()).st_size-hs, 0)//ds
+            days = []
+            if count:
+                # only last day can be updated
+                f.seek(hs+(count-1)*ds)
+                days.append(list(self.day_struct.unpack(f.read(ds))))
+            last, days = summary_rows(rows, last, days)
+            if compress and self.counter:
+                f.seek(hs)
+                data = f.read((count-1)*ds) if count else b""
+                limit = self.counter[0] - max(grouper.compress_intervals)
+                days = [
+                    day for day in [
+                        self.day_struct.unpack_from(data, pos)
+                        for pos in range(0, len(data), ds)
+                    ] + days
+                    if day[0]+grouper.one_day > limit
+                ]
+                replace_file(summary_name, self.day_header.pack(last or 0)
+                             + b"".join(self.day_struct.pack(*day)
+                                        for day in days))
+            else:
+                f.seek(0)
+                f.write(self.day_header.pack(last or 0))
+                f.seek(hs+max(count-1, 0)*ds)
+                f.write(b"".join(self.day_struct.pack(*day) for day in days))
+
+    def read_index(self, data):
+        '''
+        Return (end of descending rows, [(time, offset), ...]) from sidecar
+        index or None if index is missing or does not match logfile.
+        '''
+        try:
+            with open(self.index_name(), "rb") as f:
+                idx = f.read()
+        except IOError:
+            return None
+        entries = [self.index_struct.unpack_from(idx, pos) for pos in
+                   range(0, len(idx)//self.index_struct.size
+                         * self.index_struct.size, self.index_struct.size)]
+        if not entries:
+            return None
+        last, end = entries.pop(0)
+        h = logfile.header_length
+        if end > len(data) or data[end-1:end] != b"\n" \
+                or self.row_time(data, h) != last:
+            return None  # old index
+        return end, entries
+
+    def range_offsets(self, data, size, start, end):
+        '''
+        Return offsets of descending and of appended rows with
+        start <= time <= end as (a, b, c, d). Rows are found by bisection,
+        narrowed by sidecar index if available.
+        '''
+        h = logfile.header_length
+        lo, hi = h, None
+        index = self.read_index(data)
+        if index:
+            hi, entries = index
+            desc_end = hi
+            for t, offset in entries:
+                if t > end:
+                    lo = offset
+                elif t < start:
+                    hi = offset
+                    break
+        else:
+            last = self.row_time(data, h)
+            desc_end = hi = self.bisect_rows(
+                data, h, size, lambda t: t > last)
+        # descending rows
+        a = self.bisect_rows(data, lo, hi, lambda t: t <= end)
+        b = self.bisect_rows(data, a, hi, lambda t: t < start)
+        # appended rows in ascending order
+        c = self.bisect_rows(data, desc_end, size, lambda t: t >= start)
+        d = self.bisect_rows(data, c, size, lambda t: t > end)
+        return a, b, c, d
+
+    def read_range(self, start, end):
+        '''
+        Return list of (time, values) rows with start <= time <= end
+        sorted by time.
+        '''
+        size = os.fstat(self.f.fileno()).st_size
+        if size <= logfile.header_length:
+            return []
+        data = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            a, b, c, d = self.range_offsets(data, size, start, end)
+            rows = list(self.iter_rows(data, a, b))
+            rows.reverse()
+            rows.extend(self.iter_rows(data, c, d))
+            return rows
+        finally:
+            data.close()
+
+    def count_range(self, start, end):
+        '''
+        Return number of rows with start <= time <= end without parsing.
+        '''
+        size = os.fstat(self.f.fileno()).st_size
+        if size <= logfile.header_length:
+            return 0
+        data = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            a, b, c, d = self.range_offsets(data, size, start, end)
+            return data[a:b].count(b"\n") + data[c:d].count(b"\n")
+        finally:
+            data.close()
+
+    def update(self, data_in, data_out,
+               gauge_in=False, gauge_out=False,
+               uptime=None, counter_bits=None):
+        '''
+        Update with current values
+        '''
+        # t = long(time.mktime(time.gmtime())) # UTC time
+        t = long(time.time())  # Local time
+        delta = self.counter_delta(t, data_in, data_out,
+                                   gauge_in, gauge_out, uptime, counter_bits)
+        if delta is not None:
+            self.save(delta)
+
+    def update_many(self, rows, counter_bits=None):
+        '''
+        Update with list of (time, data_in, data_out, uptime) rows
+        and save all of them at once.
+        '''
+        deltas = []
+        for t, data_in, data_out, uptime in rows:
+            if self.counter and t < self.counter[0]:
+                continue  # already stored
+            delta = self.counter_delta(t, data_in, data_out,
+                                       uptime=uptime,
+                                       counter_bits=counter_bits)
+            if delta is not None:
+                deltas.append(delta)
+        if deltas:
+            self.save(deltas)
+        else:
+            self.f.close()
+
+    def counter_delta(self, t, data_in, data_out,
+                      gauge_in=False, gauge_out=False,
+                      uptime=None, counter_bits=None):
+        '''
+        Compute delta row from previous counter and store new counter.
+        '''
+        delta_t = 1
+        delta_in = 0
+        delta_out = 0
+        if self.counter:
+            delta_t = t - self.counter[0]
+            if delta_t == 0:
+                # ignore, no delta time, avoid division by zero
+                return None
+            if self.counter[1] is None or data_in is None:
+                pass  # unknown counter, same as first update
+            elif self.counter[1] <= data_in:
+                delta_in = data_in-self.counter[1]
+            elif counter_bits and uptime is not None and delta_t < uptime:
+                delta_in = 2**counter_bits - self.counter[1] + data_in
+            if self.counter[2] is None or data_out is None:
+                pass  # unknown counter, same as first update
+            elif self.counter[2] <= data_out:
+                delta_out = data_out-self.counter[2]
+            elif counter_bits and uptime is not None and delta_t < uptime:
+                delta_out = 2**counter_bits - self.counter[2] + data_out
+        delta_in_pt = delta_in/delta_t
+        delta_out_pt = delta_out/delta_t
+        if gauge_in:
+            delta_in_pt = data_in
+        if gauge_out:
+            delta_out_pt = data_out
+        delta = (t, delta_in_pt, delta_out_pt, delta_in_pt, delta_out_pt)
+        # if delta_in_pt>12**8 or delta_out_pt>12**8 \
+        #   or delta_in_pt<0 or delta_out_pt<0:
+        #  print(delta)
+        self.counter = (t, data_in, data_out)
+        return delta
+
+    def compress(self):
+        '''
+        Compress data
+        '''
+        self.deltas = dict(grouper().stream(
+            sorted(self.deltas.items(), reverse=True), self.counter[0]))
+
+    def merge(self, filename):
+        '''
+        Merge rows of other logfile, rows of other logfile are used for
+        same time. Newer counter is used. Rows are merged as streams
+        on full compression, otherwise both files are loaded.
+        '''
+        file2 = self.open(filename, "rb+")
+        header2 = file2.readline()  # read header
+        counter2 = header2.split(b" ")
+        if len(header2) == self.header_length and counter2[0].isdigit():
+            counter2 = (
+                long(counter2[0]),
+                self.data_type(counter2[1]),
+                self.data_type(counter2[2])
+            )
+            if not self.counter or counter2[0] > self.counter[0]:
+                self.counter = counter2
+            if self.full_compact and self.indexed and not self.deltas:
+                self.merge_f = file2  # merged in compact()
+                return
+        if self.full_compact:
+            self.load(self.f)
+        self.load(file2)
+        file2.close()
+
+    def filter_time(self, filter):
+        '''
+        Filter out data by time
+        '''
+        if not filter:
+            return self
+        if self.indexed and self.counter and not self.deltas and not any(
+                self.read_range(int(key), int(key))
+                for key in filter.split(",")):
+            return self  # nothing to filter
+        self.load(self.f)
+        for key in filter.split(","):
+            key = int(key)
+            if key in self.deltas:
+                print("Filtered: %s: %s" % (
+                    from_ts(key),
+                    ", ".join([str(x) for x in self.deltas[key]]))
+                )
+                del self.deltas[key]
+        return self
+
+    def unit_si(self, value):
+        units = dict(k=1024, m=1024**2, g=1024**3, t=1024**4, p=1024**5)
+        for unit, multiply in units.items():
+            if value[-1].lower() == unit:
+                return long(value[:-1])*multiply
+        return long(value)
+
+    def filter_value(self, filter):
+        '''
+        Filter out data by value
+        '''
+        if not filter:
+            return self
+        self.load(self.f)
+        if filter.startswith("="):
+            value = self.unit_si(filter[1:])
+            for key in self.deltas.keys():
+                for vx in self.deltas[key]:
+                    if vx == value:
+                        print("Filtered value: %s - %s" % (from_ts(key), vx))
+                        del self.deltas[key]
+                        break
+        elif filter.startswith(">"):
+            value = self.unit_si(filter[1:])
+            for key in list(self.deltas.keys()):
+                for vx in self.deltas[key]:
+                    if vx is not None and vx > value:
+                        print("Filtered value: %s - %s" % (from_ts(key), vx))
+                        del self.deltas[key]
+                        break
+        elif filter.startswith("<"):
+            value = self.unit_si(filter[1:])
+            for key in self.deltas.keys():
+                for vx in self.deltas[key]:
+                    if vx is not None and vx < value:
+                        print("Filtered value: %s - %s" % (from_ts(key), vx))
+                        del self.deltas[key]
+                        break
+        else:
+            print("Ignoring unknown filter: %s" % filter)
+        return self
+
+
+class logfile_simple(logfile):
+    # header: host service value unit
+    header_format = "%s\t%s\t%s\t%s\n"
+    data_format = "%d %s\n"
+    indexed = False
+
+    def __init__(self, filename, header, force_compress=False):
+        self.filename = filename
+        self.header_data = header
+        self.deltas = {}
+        try:
+            # binary mode required to allow seeking
+            self.f = self.open(self.filename, "rb+")
+            header = self.f.readline()  # read header
+            if compact_due(self.filename, self.first_row_time()):
+                force_compress = True
+            if force_compress:
+                self.load(self.f)
+        except OSError:
+            self.f = self.open(self.filename, "wb")
+            self.f.write(self.header())
+
+    def data_type(self, value):
+        if value is None or value == "N" or value == "None" or value == b"N" or value == b"None":
+            return None
+        return float(value)
+
+    def header(self):
+        return (self.header_format % self.header_data).encode("utf8")
+
+    def update(self, value):
+        '''
+        Update with current value
+        '''
+        ts = long(time.time())  # Local time
+        delta = (ts, value)
+        self.save(delta)
+
+    def compress(self):
+        '''
+        Compress data
+        '''
+        self.deltas = dict(grouper().stream(
+            sorted(self.deltas.items(), reverse=True), fx=['avg']))
+
+
+class logfile_binary(logfile):
+    '''
+    Logfile stored in fixed size binary records of 5 float64 values
+    (time, in, out, max in, max out), NaN is used for unknown values.
+    Header contains counter as 3 int64 values, unknown counter is stored
+    as maximal value. Text log is exported to be available for
+    grapher.js, appended rows at most once per export_interval.
+    '''
+    header_struct = struct.Struct("<qQQ")
+    header_length = header_struct.size
+    unknown = 2**64-1  # unknown counter value in header
+    export_interval = 300
+    record_struct = struct.Struct("<5d")
+    record_length = record_struct.size
+    text_export = True
+    indexed = False  # binary rows, text export is indexed
+
+    def __init__(self, filename, force_compress=False):
+        self.filename = filename
+        self.binary = os.path.splitext(filename)[0]+".bin"
+        self.deltas = {}
+        self.counter = ()
+        try:
+            self.f = self.open(self.binary, "rb+")
+            header = self.f.read(self.header_length)
+            if len(header) == self.header_length:
+                counter = self.unpack_header(header)
+                if counter[0]:
+                    self.counter = counter
+                    if compact_due(self.filename, self.first_row_time()):
+                        force_compress = True
+            if force_compress:
+                self.load(self.f)
+        except IOError:
+            self.f = self.open(self.binary, "wb+")
+            if os.path.exists(self.filename):
+                self.load_text()
+
+    def first_row_time(self):
+        pos = self.f.tell()
+        row = self.f.read(self.record_length)
+        self.f.seek(pos)
+        if len(row) < self.record_length:
+            return time.time()  # no data
+        return self.record_struct.unpack(row)[0]
+
+    def load_text(self):
+        '''
+        Load existing text logfile to convert it to binary format.
+        '''
+        print("Converting file:", self.filename)
+        f = self.open(self.filename, "rb")
+        counter = f.readline().split(b" ")
+        if counter[0].isdigit():
+            self.counter = (
+                long(counter[0]),
+                self.data_type(counter[1]),
+                self.data_type(counter[2])
+            )
+        logfile.load(self, f)
+        f.close()
+
+    def load(self, f):
+        f.seek(self.header_length)
+        data = f.read()
+        values = array("d")
+        values.frombytes(
+            data[:len(data)//self.record_length*self.record_length])
+        if sys.byteorder != "little":
+            values.byteswap()
+        it = iter(values)
+        max_time = time.time() + 3600*24  # anything beyond 1 day from now
+        for row in zip(it, it, it, it, it):
+            if row[0] > max_time:
+                print("Time from future ignored: %s: %d" %
+                      (self.binary, row[0]))
+                continue
+            self.deltas[long(row[0])] = tuple(
+                None if x != x else x for x in row[1:]
+            )
+
+    def header(self):
+        return self.header_struct.pack(*[
+            self.unknown if x is None else long(x)
+            for x in self.counter or (0, 0, 0)
+        ])
+
+    def unpack_header(self, header):
+        return tuple(
+            None if x == self.unknown else x
+            for x in self.header_struct.unpack(header)
+        )
+
+    def pack(self, delta):
+        return self.record_struct.pack(*[
+            float("nan") if x is None else x for x in delta
+        ])
+
+    def write(self, delta=None):
+        rows = delta if isinstance(delta, list) else [delta]
+        rows = [x for x in rows if x is not None]
+        if self.deltas:
+            # full save, rename old file, do not close it to leave it locked
+            old_f = self.f
+            for delta in rows:
+                self.deltas[delta[0]] = delta[1:]  # add current values
+            self.compress()
+            self.f = self.open(self.binary+'.tmp', "wb")
+            self.f.write(self.header())
+            values = array("d")
+            nan = float("nan")
+            for t in sorted(self.deltas, reverse=True):
+                values.append(t)
+                values.extend([nan if x is None else x
+                               for x in self.deltas[t]])
+            if sys.byteorder != "little":
+                values.byteswap()
+            self.f.write(values.tobytes())
+            self.f.close()
+            if BACKUP:
+                os.rename(self.binary, self.binary+"~")
+            os.rename(self.binary+'.tmp', self.binary)
+            old_f.close()  # close old file after rename
+            if self.text_export:
+                self.export()
+        else:
+            self.f.seek(0)
+            self.f.write(self.header())
+            self.f.seek(0, 2)  # EOF
+            self.f.write(b"".join(self.pack(delta) for delta in rows))
+            if self.text_export:
+                self.export_pending()
+            self.f.close()
+
+    def export_pending(self):
+        '''
+        Append rows stored since last export to text logfile, if it's
+        older than export_interval. Missing text logfile is exported whole.
+        '''
+        try:
+            if os.path.getmtime(self.filename) > \
+                    time.time() - self.export_interval:
+                return
+            with open(self.filename, "rb") as f:
+                last = long(f.read(10))
+        except (OSError, ValueError):
+            self.load(self.f)
+            self.export()
+            return
+        # appended rows are sorted by time, read them from end
+        self.f.flush()
+        rows = []
+        count = (os.fstat(self.f.fileno()).st_size - self.header_length) \
+            // self.record_length
+        for pos in range(count-1, -1, -1):
+            self.f.seek(self.header_length + pos*self.record_length)
+            row = self.record_struct.unpack(self.f.read(self.record_length))
+            if row[0] <= last:
+                break
+            rows.append((long(row[0]),) +
+                        tuple(None if x != x else x for x in row[1:]))
+        rows.reverse()
+        if rows:
+            self.export(rows)
+
+    def export(self, rows=None):
+        '''
+        Export text logfile. Full export or only append rows.
+        '''
+        header = b""
+        if self.counter:
+            header = (logfile.header_format % tuple(
+                0 if x is None else x for x in self.counter)
+            ).encode("utf8")
+        if rows is None:
+            rows = [(t,)+tuple(self.deltas[t])
+                    for t in sorted(self.deltas, reverse=True)]
+            f = self.open(self.filename+'.tmp', "wb")
+            mode = "full"
+        else:
+            try:
+                f = self.open(self.filename, "rb+")
+                mode = "append"
+            except IOError:
+                f = self.open(self.filename, "wb")
+                mode = "new"
+        if mode != "append" or len(header) == logfile.header_length:
+            f.seek(0)
+            f.write(header)
+        f.seek(0, 2)  # EOF
+        data = b"".join(
+            (self.data_format % tuple(self.store_value(x) for x in row)
+             ).encode("utf8")
+            for row in rows
+        )
+        size = f.tell()
+        f.write(data)
+        f.flush()
+        if mode == "full":
+            os.rename(self.filename+'.tmp', self.filename)
+            logfile.write_index(self)
+            logfile.precompress(self)
+        elif mode == "append":
+            logfile.precompress(self, data, size)
+        f.close()
+
+
+class logfile_ring(logfile_binary):
+    '''
+    Logfile stored in preallocated rings, one for each grouper
+    compress interval (tier). Update changes only current slot of each
+    tier in place, so cost of an update does not depend on history.
+    Slot contains: start, count, sum in, sum out, max in, max out.
+    Text log is appended on update and exported once a day.
+    '''
+    slot_struct = struct.Struct("<6d")
+    slot_length = slot_struct.size
+    tiers = [(age, int(step))
+             for age, step in sorted(grouper.compress_intervals.items())]
+
+    def __init__(self, filename, force_compress=False):
+        self.filename = filename
+        self.binary = os.path.splitext(filename)[0]+".rrd"
+        self.deltas = {}
+        self.counter = ()
+        self.export_due = False
+        try:
+            self.f = self.open(self.binary, "rb+")
+            header = self.f.read(self.header_length)
+            if len(header) == self.header_length:
+                counter = self.unpack_header(header)
+                if counter[0]:
+                    self.counter = counter
+                    if self.counter[0] < compact_slot(self.filename):
+                        # export text log once a day
+                        self.export_due = True
+            if force_compress:
+                self.load(self.f)
+        except IOError:
+            self.f = self.open(self.binary, "wb+")
+            self.f.write(self.header() + bytes(self.ring_length()))
+            if os.path.exists(self.filename):
+                self.load_text()
+
+    def ring_length(self):
+        return sum(age//step for age, step in self.tiers)*self.slot_length
+
+    def slots(self, t):
+        '''
+        Offsets of slots for time t and their start times.
+        '''
+        offset = self.header_length
+        for age, step in self.tiers:
+            count = age//step
+            yield (offset + (t//step % count)*self.slot_length,
+                   t//step*step)
+            offset += count*self.slot_length
+
+    def add(self, slot, start, values):
+        '''
+        Add values to slot and return new slot.
+        '''
+        if slot[0] != start:
+            slot = (start, 0, 0, 0, 0, 0)
+        start, count, sum_in, sum_out, max_in, max_out = slot
+        if values[0] is None or values[1] is None:
+            return slot
+        max_in_v = values[2] if values[2] is not None else values[0]
+        max_out_v = values[3] if values[3] is not None else values[1]
+        if count:
+            max_in_v = max(max_in, max_in_v)
+            max_out_v = max(max_out, max_out_v)
+        return (start, count+1, sum_in+values[0], sum_out+values[1],
+                max_in_v, max_out_v)
+
+    def load(self, f):
+        '''
+        Load slots of all tiers. Each tier is clipped to its age and to
+        time before oldest slot of previous (smaller) tiers. Slot which
+        overlaps slots of previous tiers is used without their counts
+        and sums, only maximums of such slot may include newer rows.
+        '''
+        f.seek(0)
+        data = f.read()
+        now = self.counter[0] if self.counter else time.time()
+        offset = self.header_length
+        loaded = {}  # start: (count, sum in, sum out) of previous tiers
+        oldest = None
+        for age, step in self.tiers:
+            count = age//step
+            tier = []
+            for pos in range(offset, offset+count*self.slot_length,
+                             self.slot_length):
+                start, n, sum_in, sum_out, max_in, max_out = \
+                    self.slot_struct.unpack_from(data, pos)
+                if not n or start < now-age or \
+                        (oldest is not None and start >= oldest):
+                    continue
+                if oldest is not None and start+step > oldest:
+                    # remove rows counted in previous tiers
+                    for t in range(long(oldest), long(start)+step):
+                        if t in loaded:
+                            n -= loaded[t][0]
+                            sum_in -= loaded[t][1]
+                            sum_out -= loaded[t][2]
+                    if n <= 0:
+                        continue
+                tier.append((long(start), n, sum_in, sum_out))
+                self.deltas[long(start)] = (
+                    sum_in/n, sum_out/n, max_in, max_out)
+            if tier:
+                oldest = min(slot[0] for slot in tier)
+                loaded.update((slot[0], slot[1:]) for slot in tier)
+            offset += count*self.slot_length
+
+    def write(self, delta=None):
+        rows = delta if isinstance(delta, list) else [delta]
+        rows = [x for x in rows if x is not None]
+        if self.deltas:
+            # full save, rebuild rings from data
+            for delta in rows:
+                self.deltas[delta[0]] = delta[1:]  # add current values
+            buf = bytearray(self.header() + bytes(self.ring_length()))
+            for t in sorted(self.deltas):
+                for offset, start in self.slots(long(t)):
+                    self.slot_struct.pack_into(buf, offset, *self.add(
+                        self.slot_struct.unpack_from(buf, offset),
+                        start, self.deltas[t]
+                    ))
+            self.f.seek(0)
+            self.f.write(buf)
+            self.f.truncate()
+            self.deltas = {}
+            self.load(self.f)
+            self.f.close()
+            if self.text_export:
+                self.export()
+            return
+        fd = self.f.fileno()
+        os.pwrite(fd, self.header(), 0)
+        for delta in rows:
+            for offset, start in self.slots(long(delta[0])):
+                slot = self.slot_struct.unpack(
+                    os.pread(fd, self.slot_length, offset))
+                os.pwrite(fd, self.slot_struct.pack(
+                    *self.add(slot, start, delta[1:])), offset)
+        if self.text_export and self.export_due:
+            self.load(self.f)
+            self.f.close()
+            self.export()
+        else:
+            self.f.close()
+            if self.text_export:
+                self.export(rows)
+
+
+def open_logfile(filename, force_compress=False, storage=None,
+                 rollups=None, rollup_rows=None):
+    '''
+    Open logfile with configured storage backend and rollup files.
+    '''
+    storage = storage or STORAGE
+    if storage == "binary":
+        lf = logfile_binary(filename, force_compress)
+    elif storage == "ring":
+        lf = logfile_ring(filename, force_compress)
+    else:
+        lf = logfile(filename, force_compress)
+    if rollups:
+        lf.rollups = rollups
+        lf.rollup_rows = rollup_rows or ROLLUP_ROWS
+    return lf
+
+
+def merge_rows(rows1, rows2):
+    '''
+    Merge two sequences of (time, values) rows sorted in descending order.
+    For same time only row from rows1 is used.
+    '''
+    prev = None
+    for t, values in heapq.merge(rows1, rows2, key=lambda row: row[0],
+                                 reverse=True):
+        if t != prev:
+            yield t, values
+        prev = t
+
+
+def replace_file(filename, data):
+    '''
+    Write data to temporary file and rename it to filename.
+    Temporary file is removed if write fails.
+    '''
+    try:
+        with open(filename+".tmp", "wb") as f:
+            f.write(data)
+        os.rename(filename+".tmp", filename)
+    except BaseException:
+        if os.path.exists(filename+".tmp"):
+            os.unlink(filename+".tmp")
+        raise
+
+
+def sum_rows(rows, last=None, start=None):
+    '''
+    Convert (time, in, out, ...) rows sorted by time to cumulative
+    (time, in, out) rows. Rate of each row applies to interval from
+    previous row, rows not newer than last cumulative row are skipped.
+    With start (time of newest data) rows compressed by grouper are
+    keyed by group start and their rate applies to [t, t+step).
+    Without last cumulative row first row starts from zero.
+    '''
+    if last is None:
+        if not rows:
+            return
+        last = (rows[0][0], 0.0, 0.0)
+        yield last
+    grp = grouper()
+    t0, cum_in, cum_out = last
+    for idx, row in enumerate(rows):
+        begin, t = t0, row[0]
+        tier = None
+        if start is not None:
+            tier = grp.tier(start-t)
+        if tier and tier[1] > 1 and t % tier[1] == 0:
+            begin = max(t, t0)
+            t = t+long(tier[1])  # 1/4 day interval is float
+            if idx+1 < len(rows):
+                t = min(t, rows[idx+1][0])
+            if begin > t0 and t > begin:
+                yield begin, cum_in, cum_out  # no data before group
+        if t <= begin:
+            continue
+        if row[1] is not None:
+            cum_in += row[1]*(t-begin)
+        if row[2] is not None:
+            cum_out += row[2]*(t-begin)
+        t0 = t
+        yield t, cum_in, cum_out
+
+
+def summary_rows(rows, last=None, days=None):
+    '''
+    Add (time, in, out, max in, max out) rows sorted by time to list of
+    daily [day, bytes in, bytes out, max in, max out] summaries.
+    Return time of last row and updated days.
+    '''
+    days = days or []
+    for row in rows:
+        t = row[0]
+        if last is not None and t <= last:
+            continue
+        day = int(t/grouper.one_day)*grouper.one_day
+        if not days or days[-1][0] != day:
+            days.append([day, 0.0, 0.0, 0.0, 0.0])
+        summary = days[-1]
+        if last is not None:
+            for idx in (1, 2):
+                if row[idx] is not None:
+                    summary[idx] += row[idx]*(t-last)
+        for idx in (3, 4):
+            if row[idx] is not None:
+                summary[idx] = max(summary[idx], row[idx])
+        last = t
+    return last, days
+
+
+def build_summary(filename):
+    '''
+    Create daily summary sidecar of logfile from its rows.
+    '''
+    lf = logfile.__new__(logfile)
+    lf.filename = filename
+    lf.f = lf.open(filename, "rb")
+    try:
+        header = lf.f.readline()
+        if len(header) != logfile.header_length:
+            return
+        last, days = summary_rows([
+            (t,)+tuple(values) for t, values in
+            lf.read_range(0, time.time() + 3600*24)])
+        replace_file(lf.summary_name(), logfile.day_header.pack(last or 0)
+                     + b"".join(logfile.day_struct.pack(*day)
+                                for day in days))
+    finally:
+        lf.f.close()
+
+
+def thin_sum(entries, start):
+    '''
+    Keep only last cumulative entry of each grouper interval.
+    Entries older than last interval are removed.
+    '''
+    grp = grouper()
+    ret = []
+    for idx, entry in enumerate(entries):
+        tier = grp.tier(start-entry[0])
+        if tier is None:
+            continue
+        if idx+1 < len(entries):
+            next_tier = grp.tier(start-entries[idx+1][0])
+            if next_tier == tier and \
+                    int(entries[idx+1][0]/tier[1]) == int(entry[0]/tier[1]):
+                continue
+        ret.append(entry)
+    return ret
+
+
+def build_sum(filename):
+    '''
+    Create cumulative sidecar of logfile from its rows.
+    '''
+    lf = logfile.__new__(logfile)
+    lf.filename = filename
+    lf.f = lf.open(filename, "rb")
+    try:
+        header = lf.f.readline()
+        if len(header) != logfile.header_length:
+            return
+        rows = [(t,)+tuple(values) for t, values in
+                lf.read_range(0, time.time() + 3600*24)]
+        start = max(int(header[:10]), rows[-1][0]) if rows else None
+        replace_file(lf.sum_name(), b"".join(
+            logfile.sum_struct.pack(*row)
+            for row in sum_rows(rows, start=start)))
+    finally:
+        lf.f.close()
+
+
+def read_total(filename, start=None, end=None):
+    '''
+    Return bytes transferred in and out between start and end times.
+    Cumulative values are found in sidecar by binary search and
+    interpolated between entries, so result is exact only for times
+    of entries. Sidecar is created if missing.
+    Return None if file is not a text logfile.
+    '''
+    lf = logfile.__new__(logfile)
+    lf.filename = filename
+    if not os.path.exists(lf.sum_name()):
+        build_sum(filename)
+        if not os.path.exists(lf.sum_name()):
+            return None
+    st = lf.sum_struct
+    with open(lf.sum_name(), "rb") as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        data = f.read()
+    count = len(data)//st.size
+    if not count:
+        return 0.0, 0.0
+
+    def cumulative(t):
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo+hi)//2
+            if st.unpack_from(data, mid*st.size)[0] < t:
+                lo = mid+1
+            else:
+                hi = mid
+        if lo == 0:
+            return st.unpack_from(data, 0)[1:]
+        if lo == count:
+            return st.unpack_from(data, (count-1)*st.size)[1:]
+        t0, in0, out0 = st.unpack_from(data, (lo-1)*st.size)
+        t1, in1, out1 = st.unpack_from(data, lo*st.size)
+        frac = (t-t0)/float(t1-t0)
+        return in0+(in1-in0)*frac, out0+(out1-out0)*frac
+
+    if start is None:
+        start = 0
+    if end is None:
+        end = time.time()
+    in0, out0 = cumulative(start)
+    in1, out1 = cumulative(end)
+    return in1-in0, out1-out0
+
+
+def is_rollup(filename):
+    '''
+    Return True for rollup files like name.1h.log.
+    '''
+    return re.search(r"\.[0-9]+[smhdwy]\.log$", filename) is not None
+
+
+def recompact(filename):
+    '''
+    Compress text logfile using numpy vectorized operations.
+    Rows are grouped same as grouper.load() and unknown values are
+    written as N. Return number of rows or None if file can't be
+    processed this way.
+    '''
+    import numpy as np
+    lf = logfile.__new__(logfile)
+    lf.filename = filename
+    lf.f = lf.open(filename, "rb+")
+    try:
+        data = lf.f.read()
+        pos = data.find(b"\n")+1
+        counter = data[:pos].split(b" ")
+        if pos != lf.header_length or not counter[0].isdigit():
+            return None
+        try:
+            rows = np.array(
+                data[pos:].replace(b"None", b"nan").replace(b"N", b"nan")
+                .split(), dtype=np.float64)
+        except ValueError:
+            return None  # broken row
+        if len(rows) % 5:
+            return None
+        rows = rows.reshape(-1, 5)
+        # ignore rows from future and keep last of duplicate rows
+        rows = rows[rows[:, 0] <= time.time() + 3600*24]
+        order = np.lexsort((-np.arange(len(rows)), -rows[:, 0]))
+        rows = rows[order]
+        rows = rows[np.r_[True, np.diff(rows[:, 0]) != 0]]
+        if not len(rows):
+            return None
+        # interval for each row, same as grouper.load(): first row uses
+        # first interval, next interval is taken by first later row at
+        # least as old as limit of current one (at most one per row)
+        # and rows after last interval are dropped
+        limits, ranges = zip(*grouper.compress_intervals.items())
+        age = long(counter[0])-rows[:, 0]  # ascending
+        tier = np.zeros(len(rows), dtype=np.int64)
+        first = 0  # first row of interval
+        for idx, limit in enumerate(limits):
+            first = max(first+1, np.searchsorted(age, limit, side="left"))
+            tier[first:] = idx+1
+        rows = rows[tier < len(ranges)]
+        step = np.asarray(ranges, dtype=np.float64)[tier[tier < len(ranges)]]
+        keys = np.trunc(rows[:, 0]/step)*step  # int(t/range)*range
+        starts = np.r_[0, np.flatnonzero(np.diff(keys))+1]
+        values = rows[:, 1:]
+        valid = ~np.isnan(values)
+        count = np.add.reduceat(valid, starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg = np.add.reduceat(np.where(valid, values, 0), starts)/count
+        result = np.column_stack([
+            keys[starts],
+            avg[:, 0], avg[:, 1],
+            np.fmax.reduceat(values[:, 2], starts),
+            np.fmax.reduceat(values[:, 3], starts)
+        ])
+        result[:, 1:][count == 0] = np.nan
+        f = lf.open(filename+'.tmp', "wb")
+        f.write(data[:pos])
+        if np.isnan(result).any():
+            # unknown values are stored as N, format each column
+            f.write(b"".join(
+                (" ".join("N" if x != x else "%d" % x for x in row)
+                 + "\n").encode("utf8")
+                for row in result.tolist()
+            ))
+        else:
+            f.write(((lf.data_format*len(result))
+                     % tuple(result.astype(np.int64).ravel().tolist())
+                     ).encode("utf8"))
+        f.close()
+        if BACKUP:
+            os.rename(filename, filename+"~")
+        os.rename(filename+'.tmp', filename)
+        lf.write_index()
+        lf.precompress()
+        return len(result)
+    finally:
+        lf.f.close()
+
+
+def gzip_member(data, level=9, comment=b""):
+    '''
+    Return gzip member with compressed data and optional comment.
+    Concatenated members are valid gzip file.
+    '''
+    flags = 0x10 if comment else 0  # FCOMMENT
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return b"".join([
+        b"\x1f\x8b\x08", struct.pack("<BIBB", flags, 0, 0, 255),
+        comment + b"\0" if comment else b"",
+        compressor.compress(data), compressor.flush(),
+        struct.pack("<II", zlib.crc32(data) & 0xffffffff,
+                    len(data) & 0xffffffff)
+    ])
+
+
+def gzip_header(header, size):
+    '''
+    First gzip member of logfile sidecar: uncompressed logfile header
+    with logfile size in comment. It has fixed length, so it can be
+    rewritten in place on append.
+    '''
+    return gzip_member(header, 0, b"size=%020d" % size)
+
+
+def append_gzip(filename, header, data, size):
+    '''
+    Append data to gzip sidecar of logfile and update its header.
+    Compressed members are copied to new sidecar, which replaces old one,
+    so readers never see partially written sidecar.
+    Return False if sidecar is missing or does not match logfile
+    of given size.
+    '''
+    member = gzip_header(header, size)
+    try:
+        with open(filename, "rb") as f:
+            old = f.read()
+    except IOError:
+        return False
+    # header line differs (counter changed), compare only size comment
+    comment = b"size=%020d" % size
+    if len(header) != logfile.header_length or \
+            len(old) < len(member) or \
+            old[10:10+len(comment)] != comment:
+        return False
+    replace_file(filename, gzip_header(header, size+len(data))
+                 + old[len(member):] + gzip_member(data))
+    return True
+
+
+def precompress(filename, formats=("gz",)):
+    '''
+    Write precompressed siblings of file (name.log.gz, name.log.br),
+    which can be served directly by web server (gzip_static).
+    Gzip sidecar of trafgrapher logfile starts with header member,
+    which allows to append rows, see append_gzip().
+    Return sizes of compressed files.
+    '''
+    with open(filename, "rb") as f:
+        data = f.read()
+    sizes = {}
+    header = data[:logfile.header_length]
+    for fmt in formats:
+        if fmt == "gz":
+            if header.endswith(b"\n") and header[:10].isdigit():
+                compressed = gzip_header(header, len(data)) + \
+                    gzip_member(data[len(header):])
+            else:
+                compressed = gzip_member(data)
+        elif fmt == "br":
+            try:
+                import brotli
+            except ImportError:
+                continue
+            compressed = brotli.compress(data, mode=brotli.MODE_TEXT)
+        else:
+            continue
+        with open(filename+"."+fmt+".tmp", "wb") as f:
+            f.write(compressed)
+        os.rename(filename+"."+fmt+".tmp", filename+"."+fmt)
+        sizes[fmt] = len(compressed)
+    return sizes
+
+
+def precompress_dir(path, formats=("gz",)):
+    '''
+    Write precompressed siblings for all logfiles in directory tree.
+    '''
+    total = [0, 0, 0]
+    for root, dirs, files in os.walk(path):
+        for fn in sorted(files):
+            if not fn.endswith(".log") or is_rollup(fn):
+                continue
+            filename = os.path.join(root, fn)
+            try:
+                lf = logfile.__new__(logfile)
+                lf.filename = filename
+                lf.f = lf.open(filename, "rb")  # lock against updates
+                try:
+                    sizes = precompress(filename, formats)
+                finally:
+                    lf.f.close()
+            except (IOError, OSError, LockError) as err:
+                print(err)
+                continue
+            size = os.path.getsize(filename)
+            total[0] += 1
+            total[1] += size
+            total[2] += sizes.get("gz", 0)
+            if VERBOSE:
+                print("Precompressed: %s: %s" % (filename, " ".join(
+                    "%s %d%%" % (fmt, 100*sizes[fmt]/max(size, 1))
+                    for fmt in sorted(sizes))))
+    if not QUIET:
+        print("%s: %d files, %.1f MB, gzip %.1f MB" % (
+            path, total[0], total[1]/1e6, total[2]/1e6))
+
+
+def recompact_dir(path):
+    '''
+    Recompact all logfiles in directory tree.
+    '''
+    for root, dirs, files in os.walk(path):
+        for fn in sorted(files):
+            if not fn.endswith(".log") or is_rollup(fn):
+                continue
+            filename = os.path.join(root, fn)
+            try:
+                rows = recompact(filename)
+            except LockError as err:
+                print(err)
+                continue
+            if rows is None:
+                print("Skipped:", filename)
+            elif VERBOSE:
+                print("Recompacted: %s: %d rows" % (filename, rows))
+
+
+def parse_time(value):
+    '''
+    Convert timestamp or "%Y-%m-%d %H:%M:%S" formatted time to timestamp.
+    '''
+    value = str(value).strip()
+    if ':' in value:
+        return long(time.mktime(time.strptime(value, "%Y-%m-%d %H:%M:%S")))
+    return long(value)
+
+
+def read_log(filename, start=None, end=None):
+    '''
+    Return (header, rows) of text logfile with rows between start and end
+    sorted by time or None if file is not a trafgrapher logfile.
+    Logfile is locked shared only while reading.
+    '''
+    lf = logfile.__new__(logfile)
+    lf.filename = filename
+    lf.f = open(filename, "rb")
+    try:
+        fcntl.flock(lf.f, fcntl.LOCK_SH)
+        header = lf.f.readline()
+        if len(header) != logfile.header_length or not header[:10].isdigit():
+            return None
+        if start is None:
+            start = 0
+        if end is None:
+            end = time.time() + 3600*24
+        return header, lf.read_range(start, end)
+    finally:
+        lf.f.close()
+
+
+def aggregate_rows(rows, step, agg="avg"):
+    '''
+    Group rows sorted by time to step seconds with same rules as grouper:
+    average of in/out and maximum of max in/out. Agg max or min changes
+    function for in/out columns.
+    '''
+    funcs = {"avg": "avg", "max": max, "min": min}
+    if agg not in funcs:
+        raise ValueError("Unknown aggregation: %s" % agg)
+    grp = grouper()
+    grp.compress_intervals = {float("inf"): step}
+    fx = [funcs[agg], funcs[agg], max, max]
+    ret = list(grp.stream(reversed(rows), fx=fx))
+    ret.reverse()
+    return ret
+
+
+def lttb(points, threshold):
+    '''
+    Largest-Triangle-Three-Buckets downsampling. Return indexes of at most
+    threshold points from list of (x, y) points sorted by x. Point with
+    largest triangle to previous selected point and average of next
+    bucket is selected from each bucket, so peaks are preserved.
+    '''
+    n = len(points)
+    if threshold >= n:
+        return list(range(n))
+    if threshold < 3:
+        return [0, n-1][:max(threshold, 0)]
+    every = (n-2)/(threshold-2)
+    a = 0
+    ret = [0]
+    for i in range(threshold-2):
+        # average point of next bucket
+        start = int((i+1)*every)+1
+        end = min(int((i+2)*every)+1, n)
+        avg_x = sum(x for x, y in points[start:end])/(end-start)
+        avg_y = sum(y for x, y in points[start:end])/(end-start)
+        ax, ay = points[a]
+        max_area = -1
+        for j in range(int(i*every)+1, start):
+            x, y = points[j]
+            area = abs((ax-avg_x)*(y-ay) - (ax-x)*(avg_y-ay))
+            if area > max_area:
+                max_area = area
+                a = j
+        ret.append(a)
+    ret.append(n-1)
+    return ret
+
+
+def downsample_rows(rows, threshold, column="i"):
+    '''
+    Reduce rows sorted by time to at most threshold rows selected by lttb()
+    on given column: i, o (average in/out) or I, O (max in/out).
+    Rows without value in column are dropped.
+    '''
+    columns = "ioIO"
+    if len(column) != 1 or column not in columns:
+        raise ValueError("Unknown column: %s" % column)
+    col = columns.index(column)
+    rows = [row for row in rows
+            if len(row[1]) > col and row[1][col] is not None]
+    return [rows[i] for i in lttb([(t, values[col]) for t, values in rows],
+                                  threshold)]
+
+
+def format_rows(header, rows):
+    '''
+    Format rows as text logfile.
+    '''
+    return header + b"".join(
+        (" ".join("N" if x is None else "%d" % x for x in [t]+list(values))
+         + "\n").encode("utf8")
+        for t, values in rows
+    )
+
+
+def log_journal(filename):
+    '''
+    Find journal with rows of logfile which are not fanned out yet.
+    Configs with journal in logfile directory are searched.
+    Return (journal filename, cfg, port id, entry position) or None.
+    '''
+    tdir = os.path.dirname(os.path.realpath(filename))
+    try:
+        names = os.listdir(tdir)
+    except OSError:
+        return None
+    for name in sorted(names):
+        if not name.endswith(".journal"):
+            continue
+        config_file = os.path.join(tdir, name[:-len(".journal")]+".json")
+        try:
+            with open(config_file) as f:
+                cfg = json.load(f)
+        except (IOError, ValueError):
+            continue
+        sfxs = entries(cfg.get("entry", "Octets"))
+        for idx, item in cfg.get("ifs", {}).items():
+            for pos, sfx in enumerate(sfxs):
+                log = entry_log(cfg, tdir, item.get("log", ""), sfx, pos == 0)
+                if os.path.realpath(log) == os.path.realpath(filename):
+                    return os.path.join(tdir, name), cfg, idx, pos
+    return None
+
+
+def journal_entries(filename):
+    '''
+    Return parsed (time, uptime, values) rows of journal.
+    '''
+    try:
+        with open(filename, "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            lines = f.readlines()
+    except IOError:
+        return []
+    rows = []
+    for line in lines:
+        try:
+            rows.append(json.loads(line))
+        except ValueError:
+            continue
+    return rows
+
+
+def journal_rows(jrnl, header, jrnl_entries=None):
+    '''
+    Convert journal rows of one log to rows sorted by time. Rates are
+    computed from counter in logfile header same as on fan-out.
+    Already parsed journal_entries() can be passed for multiple logs.
+    '''
+    filename, cfg, idx, pos = jrnl
+    count = len(entries(cfg.get("entry", "Octets")))
+    counter = header.split(b" ")
+    lf = logfile.__new__(logfile)
+    lf.counter = (long(counter[0]), long(counter[1]), long(counter[2]))
+    rows = []
+    if jrnl_entries is None:
+        jrnl_entries = journal_entries(filename)
+    for t, uptime, values in jrnl_entries:
+        value = values.get(idx)
+        if not value or value[pos] is None or t < lf.counter[0]:
+            continue
+        delta = lf.counter_delta(
+            t, value[pos], value[pos+count], uptime=uptime,
+            counter_bits=cfg['ifs'][idx].get('counter_bits', 64))
+        if delta is not None:
+            rows.append((delta[0], list(delta[1:])))
+    return rows
+
+
+def query_log(filename, params, jrnl=None):
+    '''
+    Return logfile data limited by query parameters: from, to (timestamps)
+    step (seconds), agg (avg, max or min) and points (maximum number
+    of rows, downsampled on column i, o, I or O). Since returns only
+    rows newer than given time. Rows from journal jrnl (see log_journal)
+    are added. None for unknown files.
+    '''
+    start = end = None
+    if "since" in params:
+        start = parse_time(params["since"])+1
+    if "from" in params:
+        start = max(start or 0, parse_time(params["from"]))
+    if "to" in params:
+        end = parse_time(params["to"])
+    data = read_log(filename, start, end)
+    if data is None:
+        return None
+    header, rows = data
+    if jrnl:
+        rows.extend(
+            row for row in journal_rows(jrnl, header)
+            if row[0] >= (start or 0) and (end is None or row[0] <= end))
+    if "step" in params:
+        step = long(params["step"])
+        if step <= 0:
+            raise ValueError("Step must be positive: %d" % step)
+        rows = aggregate_rows(rows, step, params.get("agg", "avg"))
+    if "points" in params:
+        rows = downsample_rows(rows, long(params["points"]),
+                               params.get("column", "i"))
+    return format_rows(header, rows)
+
+
+def serve(path=".", listen="127.0.0.1:8000"):
+    '''
+    Serve trafgrapher directory over HTTP. Logfiles are sliced and
+    aggregated on server side if query parameters are used,
+    see query_log(). Rows from journal, which are not fanned out yet,
+    are added to logfiles. Responses have ETag based on files and query.
+    '''
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+    from urllib.parse import urlsplit, parse_qs
+    import functools
+    query_keys = ("from", "to", "since", "step", "agg", "points", "column")
+
+    class handler(SimpleHTTPRequestHandler):
+        etag = None
+
+        def end_headers(self):
+            if self.etag:
+                self.send_header("ETag", self.etag)
+            SimpleHTTPRequestHandler.end_headers(self)
+
+        def log_message(self, format, *args):
+            if VERBOSE:
+                SimpleHTTPRequestHandler.log_message(self, format, *args)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            filename = self.translate_path(url.path)
+            if not os.path.isfile(filename):
+                return SimpleHTTPRequestHandler.do_GET(self)
+            params = dict((key, value[-1])
+                          for key, value in parse_qs(url.query).items()
+                          if key in query_keys)
+            jrnl = None
+            if filename.endswith(".log"):
+                jrnl = log_journal(filename)
+            stats = [os.stat(filename)]
+            if jrnl:
+                try:
+                    stats.append(os.stat(jrnl[0]))
+                except OSError:
+                    jrnl = None
+            self.etag = '"%s"' % hashlib.md5(repr((
+                [(st.st_ino, st.st_size, st.st_mtime) for st in stats],
+                sorted(params.items())
+            )).encode("utf8")).hexdigest()[:16]
+            match = [x.strip() for x in
+                     self.headers.get("If-None-Match", "").split(",")]
+            if self.etag in match or "*" in match:
+                self.send_response(304)
+                self.end_headers()
                 return
-            if self.counter[1] <= data_in:
-                delta_in = data_in-self.counter[1]
-            elif counter_bits and uptime is not None and delta_t < uptime:
-                delta_in = 2**counter_bits - self.counter[1] + data_in
-            if self.counter[2] <= data_out:
-                delta_out = data_out-self.counter[2]
-            elif counter_bits and uptime is not None and delta_t < uptime:
-                delta_out = 2**counter_bits - self.counter[2] + data_out
-        delta_in_pt = delta_in/delta_t
-        delta_out_pt = delta_out/delta_t
-        if gauge_in:
-            delta_in_pt = data_in
-        if gauge_out:
-            delta_out_pt = data_out
-        delta = (t, delta_in_pt, delta_out_pt, delta_in_pt, delta_out_pt)
-        # if delta_in_pt>12**8 or delta_out_pt>12**8 \
-        #   or delta_in_pt<0 or delta_out_pt<0:
-        #  print(delta)
-        self.counter = (t, data_in, data_out)
-        self.save(delta)
+            if not (params or jrnl) or not filename.endswith(".log"):
+                return SimpleHTTPRequestHandler.do_GET(self)
+            try:
+                data = query_log(filename, params, jrnl)
+            except (ValueError, OverflowError) as err:
+                self.etag = None
+                self.send_error(400, str(err))
+                return
+            if data is None:
+                return SimpleHTTPRequestHandler.do_GET(self)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    if ":" in listen:
+        host, port = listen.rsplit(":", 1)
+    else:
+        host, port = "127.0.0.1", listen
+    server = ThreadingHTTPServer(
+        (host, int(port)), functools.partial(handler, directory=path))
+    if not QUIET:
+        print("Serving %s on http://%s:%d/" % (
+            os.path.abspath(path), host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+def benchmark_storage(filenames, repeat=3):
+    '''
+    Compare load and full save (compress) times of text, binary
+    and ring logfiles and numpy recompact on copies of given logfiles.
+    '''
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for filename in filenames:
+            fn = os.path.join(tmpdir, os.path.basename(filename))
+            shutil.copy(filename, fn)
+            try:
+                start = time.time()
+                for i in range(repeat):
+                    shutil.copy(filename, fn)
+                    rows = recompact(fn)
+                print("%-15s %s: %d rows, recompact %.1f ms"
+                      % ("numpy", filename, rows,
+                         (time.time()-start)*1000/repeat))
+            except ImportError as err:
+                print("%-15s skipped: %s" % ("numpy", err))
+            shutil.copy(filename, fn)
+            logfile_binary(fn).save()  # convert to binary
+            logfile_ring(fn).save()  # convert to rings
+            for backend in [logfile, logfile_binary, logfile_ring]:
+                save = export = 0
+                for i in range(repeat):
+                    # text logfile reads rows in save(), so time
+                    # open and save together for all backends
+                    start = time.time()
+                    lf = backend(fn, force_compress=True)
+                    lf.text_export = False
+                    lf.save()
+                    save += time.time()-start
+                    if backend is not logfile:
+                        start = time.time()
+                        lf.export()
+                        export += time.time()-start
+                print("%-15s %s: %d rows, load and save %.1f ms, "
+                      "text export %.1f ms"
+                      % (backend.__name__, filename,
+                         len(open(fn, "rb").readlines())-1,
+                         save*1000/repeat,
+                         export*1000/repeat))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+class journal:
+    '''
+    Append-only per-device journal. One row with counters of all
+    interfaces is appended per poll and rows are fanned out to
+    interface logs later.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
 
-    def compress(self):
+    def open(self, mode):
+        f = open(self.filename, mode)
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def append(self, t, uptime, result, suffix="Octets"):
         '''
-        Compress data
+        Append one row: [time, uptime, {ifIndex: [in, out, ...]}]
         '''
-        grp = grouper()
-        grp.load(self.deltas, self.counter[0])
-        self.deltas = dict(grp.items())
-
-    def merge(self, filename):
-        file2 = self.open(filename, "rb+")
-        header2 = file2.readline()  # read header
-        if int(header2.split(b" ", 1)[0])>int(self.counter[0]):
-          self.header = header2
-        self.load(file2)
+        row = [t, uptime, dict(
+            (idx, [io['ifIn'+sfx] for sfx in entries(suffix)] +
+                  [io['ifOut'+sfx] for sfx in entries(suffix)])
+            for idx, io in result.items()
+        )]
+        f = self.open("ab")
+        try:
+            f.write((json.dumps(row, separators=(',', ':'))+"\n")
+                    .encode("utf8"))
+        finally:
+            f.close()
 
-    def filter_time(self, filter):
+    def due(self, cadence):
         '''
-        Filter out data by time
+        Return True if first row is older than cadence seconds.
         '''
-        if not filter:
-            return self
-        self.load(self.f)
-        for key in filter.split(","):
-            key = int(key)
-            if key in self.deltas:
-                print("Filtered: %s: %s" % (
-                    from_ts(key),
-                    ", ".join([str(x) for x in self.deltas[key]]))
-                )
-                del self.deltas[key]
-        return self
-
-    def unit_si(self, value):
-        units = dict(k=1024, m=1024**2, g=1024**3, t=1024**4, p=1024**5)
-        for unit, multiply in units.items():
-            if value[-1].lower() == unit:
-                return long(value[:-1])*multiply
-        return long(value)
+        try:
+            with open(self.filename, "rb") as f:
+                row = f.readline()
+        except IOError:
+            return False
+        if not row:
+            return False
+        try:
+            return json.loads(row)[0] <= time.time() - cadence
+        except (ValueError, IndexError):
+            return True
 
-    def filter_value(self, filter):
+    def fanout(self, cfg, tdir, suffix="Octets", force_compress=False,
+               filter_time=None, filter_value=None):
         '''
-        Filter out data by value
+        Write journal rows to interface logs and truncate journal.
         '''
-        if not filter:
-            return self
-        self.load(self.f)
-        if filter.startswith("="):
-            value = self.unit_si(filter[1:])
-            for key in self.deltas.keys():
-                for vx in self.deltas[key]:
-                    if vx == value:
-                        print("Filtered value: %s - %s" % (from_ts(key), vx))
-                        del self.deltas[key]
-                        break
-        elif filter.startswith(">"):
-            value = self.unit_si(filter[1:])
-            for key in list(self.deltas.keys()):
-                for vx in self.deltas[key]:
-                    if vx is not None and vx > value:
-                        print("Filtered value: %s - %s" % (from_ts(key), vx))
-                        del self.deltas[key]
-                        break
-        elif filter.startswith("<"):
-            value = self.unit_si(filter[1:])
-            for key in self.deltas.keys():
-                for vx in self.deltas[key]:
-                    if vx is not None and vx < value:
-                        print("Filtered value: %s - %s" % (from_ts(key), vx))
-                        del self.deltas[key]
-                        break
-        else:
-            print("Ignoring unknown filter: %s" % filter)
-        return self
+        f = self.open("ab+")
+        try:
+            f.seek(0)
+            rows = []
+            for row in f.readlines():
+                try:
+                    rows.append(json.loads(row))
+                except ValueError:
+                    print("Ignoring journal row: %s: %r" %
+                          (self.filename, row))
+            sfxs = entries(suffix)
+            for idx in cfg['ifs']:
+                for pos, sfx in enumerate(sfxs):
+                    data = [
+                        (t, values[idx][pos], values[idx][pos+len(sfxs)],
+                         uptime)
+                        for t, uptime, values in rows
+                        if values.get(idx, [None])[pos] is not None
+                    ]
+                    if not data:
+                        continue
+                    try:
+                        open_logfile(
+                            entry_log(cfg, tdir, cfg['ifs'][idx]['log'],
+                                      sfx, pos == 0),
+                            force_compress, cfg.get("storage"),
+                            cfg.get("rollups"), cfg.get("rollup_rows")
+                        ).filter_time(
+                            filter_time
+                        ).filter_value(
+                            filter_value
+                        ).update_many(
+                            data,
+                            counter_bits=cfg['ifs'][idx].get(
+                                'counter_bits', 64)
+                        )
+                    except LockError as err:
+                        print(err)
+            f.truncate(0)
+        finally:
+            f.close()
 
 
-class logfile_simple(logfile):
-    # header: host service value unit
-    header_format = "%s\t%s\t%s\t%s\n"
-    data_format = "%d %s\n"
+def journal_name(config_file):
+    return os.path.splitext(config_file)[0]+".journal"
 
-    def __init__(self, filename, header, force_compress=False):
-        self.filename = filename
-        self.header_data = header
-        self.deltas = {}
-        try:
-            mtime = os.stat(self.filename).st_mtime
-            # binary mode required to allow seeking
-            self.f = self.open(self.filename, "rb+")
-            header = self.f.readline()  # read header
-            if mtime//grouper.one_day < time.time()//grouper.one_day:
-                force_compress = True
-            if force_compress:
-                self.load(self.f)
-        except OSError:
-            self.f = self.open(self.filename, "wb")
-            self.f.write(self.header())
 
-    def data_type(self, value):
-        if value is None or value == "N" or value == "None" or value == b"N" or value == b"None":
-            return None
-        return float(value)
+def bundle_name(config_file, name="bundle"):
+    return "%s.%s.json" % (os.path.splitext(config_file)[0], name)
 
-    def header(self):
-        return (self.header_format % self.header_data).encode("utf8")
 
-    def update(self, value):
-        '''
-        Update with current value
-        '''
-        ts = long(time.time())  # Local time
-        delta = (ts, value)
-        self.save(delta)
+def bundle_due(filename, cadence):
+    '''
+    Return True if bundle file is missing or older than cadence seconds.
+    '''
+    try:
+        return os.path.getmtime(filename) <= time.time() - cadence
+    except OSError:
+        return True
+
+
+def write_bundle(cfg, tdir, config_file, start=None, name="bundle"):
+    '''
+    Write rows of all interface logs in config sorted by time to one
+    JSON file keyed by port id, so web interface can load whole device
+    with one request. Only rows since start are written to tail file.
+    Rows from journal, which are not fanned out yet, are added.
+    Missing values are null.
+    '''
+    bundle = dict(time=long(time.time()), ifs={})
+    if start is not None:
+        bundle["from"] = start
+    jrnl = journal_name(config_file)
+    jrnl_entries = journal_entries(jrnl)
+    for port_id, item in cfg.get("ifs", {}).items():
+        if not item.get("log"):
+            continue
+        try:
+            data = read_log(os.path.join(tdir, item["log"]), start)
+        except IOError:
+            continue
+        if data is not None:
+            header, rows = data
+            if jrnl_entries:
+                rows.extend(
+                    row for row in journal_rows(
+                        (jrnl, cfg, port_id, 0), header, jrnl_entries)
+                    if row[0] >= (start or 0))
+            bundle["ifs"][port_id] = [
+                [t]+list(values) for t, values in rows]
+    filename = bundle_name(config_file, name)
+    with open(filename+".tmp", "wt") as f:
+        json.dump(bundle, f, separators=(",", ":"))
+    os.rename(filename+".tmp", filename)
+
+
+def write_bundle_background(cfg, tdir, config_file, start=None,
+                            name="bundle"):
+    '''
+    Write bundle in background thread, so poll is not delayed by reading
+    of all logs. Bundle which is still being written is skipped.
+    '''
+    filename = bundle_name(config_file, name)
+    with BUNDLE_LOCK:
+        if filename in BUNDLES:
+            return
+        BUNDLES.add(filename)
 
-    def compress(self):
-        '''
-        Compress data
-        '''
-        grp = grouper()
-        grp.load(self.deltas)
-        self.deltas = dict(grp.items(['avg']))
+    def run():
+        try:
+            write_bundle(cfg, tdir, config_file, start, name)
+        finally:
+            with BUNDLE_LOCK:
+                BUNDLES.discard(filename)
+    threading.Thread(target=run).start()
+
+
+def store_io(cfg, tdir, result, uptime, suffix="Octets",
+             force_compress=False, filter_time=None, filter_value=None,
+             config_file=None):
+    '''
+    Write results directly to logs or append them to journal
+    if "journal" config option (fan-out cadence in seconds) is set.
+    Bundle of all logs is written if "bundle" config option (cadence
+    in seconds) is set. Tail file with rows of last "tail" seconds
+    is written on each update for incremental reloads. Both are
+    written in background.
+    '''
+    cadence = cfg.get("journal", JOURNAL)
+    if not cadence or config_file is None:
+        write_io(cfg, tdir, result, uptime, suffix,
+                 force_compress, filter_time, filter_value)
+    else:
+        for idx, io in result.items():
+            if io['error']:
+                print(io['error'])
+        jrnl = journal(journal_name(config_file))
+        jrnl.append(long(time.time()), uptime, result, suffix)
+        if force_compress or filter_time or filter_value \
+                or jrnl.due(cadence):
+            jrnl.fanout(cfg, tdir, suffix,
+                        force_compress, filter_time, filter_value)
+    cadence = cfg.get("bundle")
+    if cadence and config_file is not None \
+            and bundle_due(bundle_name(config_file), cadence):
+        write_bundle_background(cfg, tdir, config_file)
+    window = cfg.get("tail")
+    if window and config_file is not None:
+        write_bundle_background(cfg, tdir, config_file,
+                                long(time.time()-window), "tail")
 
 
 def update_io(cfg, tdir, community_name="public", suffix="Octets",
               force_compress=False,
-              filter_time=None, filter_value=None):
+              filter_time=None, filter_value=None, config_file=None):
     ids = list(cfg['ifs'].keys())
     IP = cfg['ip']
-    snmpc = SNMP(IP, community_name)
-    uptime = snmpc.get_uptime()
-    if uptime is None:
-        return
-    for idx, io in snmpc.getall(ids, ifs=cfg['ifs'], suffix=suffix).items():
+    snmpc = snmp_connect(IP, community_name)
+    if snmpc.sizer.filename is None:
+        snmpc.sizer = pdu_sizer(config_file)
+    try:
+        uptime = snmpc.get_uptime()
+        if uptime is None:
+            return
+        result = snmpc.getall(
+            ids, ifs=cfg['ifs'], suffix=suffix,
+            bulk=cfg.get("bulk", SNMP_BULK),
+            max_repetitions=cfg.get("max_repetitions")
+        )
+    finally:
+        snmp_release(snmpc)
+    snmpc.sizer.save()
+    store_io(
+        cfg, tdir, result,
+        uptime, suffix, force_compress, filter_time, filter_value,
+        config_file
+    )
+
+
+async def aupdate_io(cfg, tdir, community_name="public", suffix="Octets",
+                     force_compress=False,
+                     filter_time=None, filter_value=None, config_file=None):
+    ids = list(cfg['ifs'].keys())
+    snmpc = snmp_connect(cfg['ip'], community_name, "asyncio")
+    if snmpc.sizer.filename is None:
+        snmpc.sizer = pdu_sizer(config_file)
+    try:
+        uptime = await snmpc.aget_uptime()
+        if uptime is None:
+            return
+        result = await snmpc.agetall(
+            ids, ifs=cfg['ifs'], suffix=suffix,
+            bulk=cfg.get("bulk", SNMP_BULK),
+            max_repetitions=cfg.get("max_repetitions")
+        )
+    finally:
+        snmp_release(snmpc)
+    snmpc.sizer.save()
+    store_io(
+        cfg, tdir, result,
+        uptime, suffix, force_compress, filter_time, filter_value,
+        config_file
+    )
+
+
+def entry_log(cfg, tdir, log, suffix, first=True):
+    '''
+    Log filename for entry. Logs of other entries than first one are
+    stored in directories from "entry_dirs" config option or with
+    entry name appended to log name.
+    '''
+    entry_dirs = cfg.get("entry_dirs", {})
+    if suffix in entry_dirs:
+        return os.path.join(tdir, entry_dirs[suffix], log)
+    if not first:
+        log = "%s_%s.log" % (log.rsplit(".log", 1)[0], suffix.lower())
+    return os.path.join(tdir, log)
+
+
+def write_io(cfg, tdir, result, uptime, suffix="Octets",
+             force_compress=False, filter_time=None, filter_value=None):
+    for idx, io in result.items():
         if io['error']:
             print(io['error'])
             if VERBOSE:
                 print(json.dumps(cfg['ifs'][idx],
                                  indent=2, separators=(',', ': ')))
-        else:
+        for sfx in entries(suffix):
+            if io['ifIn'+sfx] is None:
+                continue
             try:
-                logfile(
-                    os.path.join(tdir, cfg['ifs'][idx]['log']),
-                    force_compress
+                open_logfile(
+                    entry_log(cfg, tdir, cfg['ifs'][idx]['log'], sfx,
+                              sfx == entries(suffix)[0]),
+                    force_compress, cfg.get("storage"),
+                    cfg.get("rollups"), cfg.get("rollup_rows")
                 ).filter_time(
                     filter_time
                 ).filter_value(
                     filter_value
                 ).update(
-                    io['ifIn'+suffix], io['ifOut'+suffix],
+                    io['ifIn'+sfx], io['ifOut'+sfx],
                     uptime=uptime,
                     counter_bits=cfg['ifs'][idx].get('counter_bits', 64)
                 )
@@ -1072,11 +4070,17 @@ def update_io(cfg, tdir, community_name="public", suffix="Octets",
 
 
 def update_value(cfg, tdir, community_name="public", force_compress=False,
-                 filter_time=None, filter_value=None):
+                 filter_time=None, filter_value=None, config_file=None):
     ids = list(cfg['oids'].keys())
     IP = cfg['ip']
-    snmpc = SNMP(IP, community_name)
-    vals = snmpc.getsome("", cfg['oids'].keys())
+    snmpc = snmp_connect(IP, community_name)
+    if snmpc.sizer.filename is None:
+        snmpc.sizer = pdu_sizer(config_file)
+    try:
+        vals = snmpc.getsome("", cfg['oids'].keys())
+    finally:
+        snmp_release(snmpc)
+    snmpc.sizer.save()
     for val, data in zip(vals, cfg['oids'].values()):
         #print(float(val)*data['scale'], data)
         replaces = dict(data.get("replaces", []))
@@ -1101,18 +4105,30 @@ def update_value(cfg, tdir, community_name="public", force_compress=False,
             print(err)
 
 
-def merge_logfiles(cfg, target_dir, merge_dir):
-    for data in cfg['ifs'].values():
-        print("Merge:", data["log"])
-        try:
-            lf = logfile(
-                     os.path.join(target_dir, data['log']),
-                     force_compress=True
-                 )
-            lf.merge(os.path.join(merge_dir, data['log']))
-            lf.save()
-        except LockError as err:
-            print(err)
+def merge_logfiles(cfg, target_dir, merge_dir, jobs=1):
+    '''
+    Merge logfiles of config with logfiles from merge_dir,
+    in process pool if jobs > 1.
+    '''
+    import multiprocessing
+    tasks = [
+        (os.path.join(target_dir, data['log']),
+         os.path.join(merge_dir, data['log']))
+        for data in cfg['ifs'].values() if 'log' in data
+    ]
+    pool = None
+    if jobs > 1 and not multiprocessing.current_process().daemon:
+        pool = multiprocessing.get_context("fork").Pool(jobs)
+        results = pool.imap_unordered(maintain_log, tasks)
+    else:
+        results = map(maintain_log, tasks)
+    for filename, size, error in results:
+        print("Merge:", os.path.relpath(filename, target_dir))
+        if error:
+            print("ERROR: %s: %s" % (filename, error))
+    if pool:
+        pool.close()
+        pool.join()
 
 
 def read_file(filename, row_name, column):
@@ -1142,9 +4158,9 @@ def update_local(cfg, tdir, force_compress=False,
                  filter_time=None, filter_value=None):
     for key, value in cfg['ifs'].items():
         try:
-            logfile(
+            open_logfile(
                 os.path.join(tdir, value['log']),
-                force_compress
+                force_compress, cfg.get("storage")
             ).filter_time(
                 filter_time
             ).filter_value(
@@ -1443,7 +4459,623 @@ def select_by_key(data, selector):
     return data
 
 
-def process_configs(files):
+def read_config(fn):
+    '''
+    Split community from config filename and load config.
+    '''
+    if '@' in fn:
+        community, fn = fn.split('@', 1)
+    else:
+        community = 'public'
+    if not os.path.exists(fn):
+        print("Configuration file doesn't exist [%s]!" % fn)
+        return community, fn, None
+    if CONFIG_CACHE is None:
+        return community, fn, json.load(open(fn))
+    # daemon mode, reload config only when changed
+    mtime = os.stat(fn).st_mtime
+    if fn not in CONFIG_CACHE or CONFIG_CACHE[fn][0] != mtime:
+        if VERBOSE and fn in CONFIG_CACHE:
+            print("Reloading config:", fn)
+        try:
+            CONFIG_CACHE[fn] = (mtime, json.load(open(fn)))
+        except (IOError, ValueError) as err:
+            # keep previous config until file is fixed
+            print("ERROR: Unable to load config %s: %s" % (fn, err))
+            CONFIG_CACHE[fn] = (mtime, CONFIG_CACHE.get(fn, (0, None))[1])
+    return community, fn, CONFIG_CACHE[fn][1]
+
+
+def is_snmp_io(cfg):
+    return cfg is not None and 'ifs' in cfg and "cmd_type" not in cfg \
+        and "--local" not in opts and "--merge-dir" not in opts
+
+
+def process_config(fn, filter_time="", filter_value="", force_compress=False,
+                   entry="Octets"):
+    community, fn, cfg = read_config(fn)
+    if cfg is None:
+        return "MISSING"
+    # update env
+    if "PATH" in os.environ and ":/sbin:/usr/sbin" not in os.environ["PATH"]:
+        os.environ["PATH"] += ":/sbin:/usr/sbin"
+    prefix = os.path.dirname(fn)
+    if "prefix" in cfg:
+        prefix = cfg["prefix"]
+    ps = pd = None
+    if "--local" in opts:
+        tdir = os.path.dirname(os.path.realpath(fn))
+        update_local(
+            cfg, tdir, force_compress,
+            filter_time=filter_time, filter_value=filter_value
+        )
+    elif "--merge-dir" in opts:
+        tdir = os.path.dirname(os.path.realpath(fn))
+        merge_logfiles(cfg, tdir, opts["--merge-dir"][0],
+                       int(opts.get("--jobs", opts.get("-j", [1]))[0]))
+    elif "cmd_type" in cfg:
+        if cfg["cmd_type"] == "sh":
+            for rowid, row in cfg["ifs"].items():
+                value = os.popen(row["cmd"]).read().strip()
+                try:
+                    lf = logfile_simple(
+                        os.path.join(prefix, row["log"]),
+                        (row["cmd"], "-", "-", row.get("unit", "-")),
+                        force_compress=force_compress
+                    ).filter_time(filter_time).filter_value(filter_value)
+                    lf.update_valid(value)
+                except LockError as err:
+                    print(err)
+        elif cfg["cmd_type"] == "ipset":
+            ps = ipset(cfg["cmd_src"])
+            pd = ipset(cfg["cmd_dst"])
+        elif cfg["cmd_type"] == "iptables":
+            ps = iptables_dst(cfg["cmd_dst"])
+            pd = iptables_src(cfg["cmd_src"])
+        elif cfg["cmd_type"] == "nftables":
+            ps = nftables_set(cfg["cmd_dst"])
+            pd = nftables_set(cfg["cmd_src"])
+        elif cfg["cmd_type"] == "netdev":
+            ps = proc_net_dev("rx", cfg["net_dev_filename"])
+            pd = proc_net_dev("tx", cfg["net_dev_filename"])
+        elif cfg["cmd_type"] == "json":
+            data = json.loads(fread(cfg["json"], prefix=prefix))
+            for rowid, row in cfg["ifs"].items():
+                value = select_by_key(data, row["selector"])
+                try:
+                    lf = logfile_simple(
+                        os.path.join(prefix, row["log"]),
+                        (row["selector"], "-", "-", row.get("unit", "-")),
+                        force_compress=force_compress
+                    ).filter_time(filter_time).filter_value(filter_value)
+                    lf.update_valid(value)
+                except LockError as err:
+                    print(err)
+        elif cfg["cmd_type"] == "files":
+            max_age = int(cfg.get("max_age", 0))
+            for cmd_name, cmd in cfg["ifs"].items():
+                try:
+                    if "file" in cmd:
+                        if max_age > 0:
+                            file_age = time.time() - \
+                                os.stat(os.path.join(
+                                    prefix, cmd["file"])).st_mtime
+                            if file_age > max_age:
+                                print("Data file %s older than %d seconds for '%s'."
+                                      % (cmd["file"], file_age, cmd.get("ifDescr", "")))
+                                continue
+                        fc = open(os.path.join(prefix, cmd["file"])
+                                  ).read().strip()
+                        if fc:
+                            lf = logfile_simple(
+                                os.path.join(prefix, cmd["log"]),
+                                (cmd["file"], "-", "-", "-"),
+                                force_compress=force_compress
+                            ).filter_time(filter_time).filter_value(filter_value)
+                            lf.update_valid(open(os.path.join(prefix, cmd["file"])
+                                                ).read().strip())
+                    elif "file2" in cmd:
+                        if max_age > 0:
+                            file_age = time.time() - \
+                                os.stat(os.path.join(
+                                    prefix, cmd["file"])).st_mtime
+                            if file_age > max_age:
+                                print("Data file %s older than %d seconds for '%s'."
+                                      % (cmd["file"], file_age, cmd.get("ifDescr", "")))
+                                continue
+                        fc = open(os.path.join(prefix, cmd["file2"])
+                                  ).read().strip().split()
+                        if fc:
+                            lf = open_logfile(os.path.join(prefix, cmd["log"]),
+                                              storage=cfg.get("storage")
+                                              ).filter_time(filter_time).filter_value(filter_value)
+                            ps, pd = [
+                                float(x)
+                                for x in open(os.path.join(prefix, cmd["file2"])
+                                              ).read().strip().split()
+                            ]
+                            lf.update(ps, pd)
+                except LockError as err:
+                    print(err)
+        elif cfg["cmd_type"] == "key_value":
+            data = dict([
+                x.split(": ", 1)
+                for x in nsplit(fread(cfg["data_url"]))
+                if ": " in x
+            ])
+            for rowid, row in cfg["ifs"].items():
+                value = data[row["data_key"]]
+                try:
+                    lf = logfile_simple(
+                        os.path.join(prefix, row["log"]),
+                        (row["data_key"], "-", "-", row.get("unit", "-")),
+                        force_compress=force_compress
+                    ).filter_time(filter_time).filter_value(filter_value)
+                    lf.update_valid(value)
+                except LockError as err:
+                    print(err)
+        elif cfg["cmd_type"] == "pid_cpu_usage":
+            usages = pid_cpu_usage()
+            for cmd_name, cmd in cfg["ifs"].items():
+                try:
+                    lf = open_logfile(os.path.join(prefix, cmd["log"]),
+                                      storage=cfg.get("storage"))
+                    usage = usages.cpu_usage(cmd["re_cmd"])
+                    if usage:
+                        lf.update(usage[2]+usage[3], usage[0]+usage[1])
+                except LockError as err:
+                    print(err)
+        else:
+            print("Unknown command type:", cfg["cmd_type"])
+        if ps and pd:
+            list(ps.items()), list(pd.items())  # load object
+            for ip in cfg["ifs"].values():
+                ipid = ip['ifName']
+                #print(ip['ifName'], pd.bytes[ipid], ps.bytes[ipid])
+                try:
+                    lf = open_logfile(os.path.join(prefix, ip['log']),
+                                      storage=cfg.get("storage")
+                                      ).filter_time(filter_time).filter_value(filter_value)
+                    if ipid in pd.bytes and ipid in ps.bytes:
+                        lf.update(pd.bytes[ipid], ps.bytes[ipid])
+                    elif not QUIET:
+                        print("Missing key:", ipid)
+                except LockError as err:
+                    print(err)
+    else:
+        tdir = os.path.dirname(os.path.realpath(fn))
+        if 'ifs' in cfg:
+            update_io(
+                cfg, tdir, community, suffix=cfg.get("entry", entry),
+                force_compress=force_compress,
+                filter_time=filter_time, filter_value=filter_value,
+                config_file=fn
+            )
+        elif 'oids' in cfg:
+            update_value(
+                cfg, tdir, community, force_compress=force_compress,
+                filter_time=filter_time, filter_value=filter_value,
+                config_file=fn
+            )
+        else:
+            print("Missing ifs or oids in cfg file!")
+
+
+def process_config_timed(fn, deadline=0, **kwargs):
+    '''
+    Process one config file within deadline, return timing information.
+    '''
+    start = time.time()
+    status = "OK"
+    if deadline:
+        signal.signal(signal.SIGALRM, deadline_handler)
+        signal.setitimer(signal.ITIMER_REAL, deadline)
+    try:
+        status = process_config(fn, **kwargs) or status
+    except DeadlineError:
+        status = "DEADLINE"
+    except SystemExit as err:
+        # exit in pool worker would lose result of this config
+        status = str(err.code or "EXIT")
+    except Exception as err:
+        status = "ERROR: %s" % err
+    finally:
+        if deadline:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return fn, time.time()-start, status
+
+
+async def apoll_config(fn, deadline=0, busy=None, **kwargs):
+    '''
+    Poll one config in asyncio loop, return timing information.
+    SNMP interface configs use asyncio engine, other configs are
+    processed in thread pool. Thread can't be stopped on deadline,
+    its future is stored to busy dictionary.
+    '''
+    import asyncio
+    import functools
+    start = time.time()
+    status = "OK"
+    try:
+        community, cfg_fn, cfg = read_config(fn)
+        if SNMP_ENGINE == "asyncio" and is_snmp_io(cfg):
+            await asyncio.wait_for(aupdate_io(
+                cfg, os.path.dirname(os.path.realpath(cfg_fn)),
+                community, suffix=cfg.get("entry", kwargs["entry"]),
+                force_compress=kwargs["force_compress"],
+                filter_time=kwargs["filter_time"],
+                filter_value=kwargs["filter_value"],
+                config_file=cfg_fn
+            ), deadline or None)
+        else:
+            future = asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(process_config, fn, **kwargs))
+            if busy is not None:
+                busy[fn] = future
+            status = await asyncio.wait_for(
+                asyncio.shield(future), deadline or None) or status
+    except asyncio.TimeoutError:
+        status = "DEADLINE"
+    except SystemExit as err:
+        status = str(err.code or "EXIT")
+    except Exception as err:
+        status = "ERROR: %s" % err
+    return fn, time.time()-start, status
+
+
+def process_configs_async(files, deadline=0, **kwargs):
+    '''
+    Poll all SNMP interface configs concurrently in one asyncio loop.
+    Other configs are processed in thread pool of the loop.
+    '''
+    import asyncio
+
+    async def poll_all():
+        return await asyncio.gather(*[
+            apoll_config(fn, deadline, **kwargs) for fn in files
+        ])
+
+    return asyncio.run(poll_all())
+
+
+def next_poll(now, fn, interval):
+    '''
+    Next poll time of config. Each config has stable phase inside
+    interval to spread polls of many configs.
+    '''
+    phase = zlib.crc32(fn.encode("utf8")) % interval
+    return (int(now-phase)//interval+1)*interval + phase
+
+
+def daemon(files, interval=60, jobs=8, deadline=0, **kwargs):
+    '''
+    Poll configs forever. Configs and SNMP sessions are kept in memory,
+    config is reloaded when it's file changes. Poll interval can be
+    changed by "interval" key in config.
+    '''
+    import asyncio
+    import heapq
+    from concurrent.futures import ThreadPoolExecutor
+    global CONFIG_CACHE, SNMP_SESSIONS
+    CONFIG_CACHE = {}
+    SNMP_SESSIONS = {}
+
+    def config_interval(fn):
+        cfg = read_config(fn)[2] or {}
+        try:
+            if int(cfg.get("interval", interval)) > 0:
+                return int(cfg.get("interval", interval))
+        except (TypeError, ValueError):
+            pass
+        print("ERROR: Wrong interval in config %s: %s"
+              % (fn, cfg.get("interval")))
+        return interval
+
+    busy = {}  # config processed in thread
+
+    async def poll(fn):
+        fn, elapsed, status = await apoll_config(
+            fn, deadline, busy, **kwargs)
+        if VERBOSE or status != "OK":
+            print("%s %s: %.2fs %s"
+                  % (time.strftime("%Y-%m-%d %H:%M:%S"), fn, elapsed, status))
+
+    async def run():
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max(jobs, 1)))
+        queue = []
+        for fn in files:
+            heapq.heappush(queue, (
+                next_poll(time.time(), fn, config_interval(fn)), fn
+            ))
+        running = {}
+        period = None
+        while queue:
+            t, fn = queue[0]
+            if t > time.time():
+                await asyncio.sleep(t-time.time())
+                continue
+            if period != t//interval:
+                # compression budget is for each interval
+                period = t//interval
+                COMPACT_DONE[:] = [0, 0.0]
+            heapq.heappop(queue)
+            if (fn in running and not running[fn].done()) or \
+                    (fn in busy and not busy[fn].done()):
+                print("Previous poll still running, skipping:", fn)
+            else:
+                running[fn] = asyncio.ensure_future(poll(fn))
+            heapq.heappush(queue, (
+                next_poll(time.time(), fn, config_interval(fn)), fn
+            ))
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def print_timing(timing):
+    print("%-50s %8s  %s" % ("Config", "Time", "Status"))
+    for fn, elapsed, status in sorted(
+            timing, key=lambda x: -(x[1] or 0)):
+        if elapsed is None:
+            print("%-50s %8s  %s" % (fn, "-", status))
+        else:
+            print("%-50s %7.2fs  %s" % (fn, elapsed, status))
+
+
+def maintenance_tasks(paths, merge_dir=None):
+    '''
+    List of (logfile, logfile to merge) for all logfiles in directory
+    trees or config files.
+    '''
+    tasks = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                for fn in sorted(files):
+                    if fn.endswith(".log") and not is_rollup(fn):
+                        filename = os.path.join(root, fn)
+                        tasks.append((filename, merge_dir and os.path.join(
+                            merge_dir, os.path.relpath(filename, path))))
+            continue
+        community, fn, cfg = read_config(path)
+        if cfg is None:
+            print("Missing config file:", path)
+            continue
+        tdir = cfg.get("prefix", os.path.dirname(os.path.realpath(fn)))
+        for data in cfg.get("oids", {}).values():
+            tasks.append((os.path.join(tdir, data['log']),
+                          merge_dir and os.path.join(merge_dir, data['log'])))
+        sfxs = entries(cfg.get("entry", "Octets"))
+        for data in cfg.get("ifs", {}).values():
+            if "log" not in data:
+                continue
+            for sfx in sfxs:
+                log = entry_log(cfg, tdir, data['log'], sfx, sfx == sfxs[0])
+                tasks.append((log, merge_dir and os.path.join(
+                    merge_dir, os.path.relpath(log, tdir))))
+    return tasks
+
+
+def top_tasks(paths):
+    '''
+    List of (logfile, description) for all logfiles in directory
+    trees or config files. Description is taken from config files.
+    '''
+    configs, logs = [], []
+    for path in paths:
+        if not os.path.isdir(path):
+            configs.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            for fn in sorted(files):
+                filename = os.path.join(root, fn)
+                if fn.endswith(".log") and not is_rollup(fn):
+                    logs.append(filename)
+                elif fn.endswith(".json") and not (
+                        fn.endswith(".bundle.json") or
+                        fn.endswith(".tail.json")):
+                    configs.append(filename)
+    names = {}
+    for path in configs:
+        try:
+            community, fn, cfg = read_config(path)
+        except ValueError:
+            continue  # not a config file
+        if not isinstance(cfg, dict) or "ifs" not in cfg:
+            continue
+        tdir = cfg.get("prefix", os.path.dirname(os.path.realpath(fn)))
+        for data in cfg["ifs"].values():
+            if "log" in data:
+                filename = os.path.realpath(os.path.join(tdir, data["log"]))
+                names[filename] = " ".join(
+                    x for x in (cfg.get("name", cfg.get("ip")),
+                                data.get("ifDescr"), data.get("ifAlias"))
+                    if x)
+                if filename not in logs:
+                    logs.append(filename)
+    return [(filename, names.get(os.path.realpath(filename), ""))
+            for filename in sorted(set(logs))]
+
+
+def top_bound(filename, start, end, metric="avg"):
+    '''
+    Upper bound of metric computed from daily summary sidecar
+    or None if summary is missing. Rate of each row is at most
+    max in + max out of its day, also after compression, so highest
+    daily maximum bounds all metrics of top_value().
+    '''
+    lf = logfile.__new__(logfile)
+    lf.filename = filename
+    hs, ds = logfile.day_header.size, logfile.day_struct.size
+    try:
+        with open(lf.summary_name(), "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            data = f.read()
+    except IOError:
+        return None
+    days = [logfile.day_struct.unpack_from(data, pos)
+            for pos in range(hs, len(data)-ds+1, ds)]
+    peak = max([day[3]+day[4] for day in days
+                if day[0] <= end and day[0]+grouper.one_day > start] or [0])
+    if metric == "total":
+        return peak*max(end-start, 1)
+    return peak
+
+
+def top_value(task, start, end, metric="avg"):
+    '''
+    Return (filename, description, value, in, out) for one logfile.
+    Value of max is maximum of max in + max out, total is transferred
+    bytes and avg is total divided by time range.
+    '''
+    filename, description = task
+    try:
+        data = read_log(filename, start, end)
+    except IOError:
+        data = None
+    if data is None:
+        return filename, description, None, 0, 0
+    rows = [(t,)+tuple(values) for t, values in data[1]]
+    if metric == "max":
+        value_in = max([row[3] for row in rows if row[3] is not None] or [0])
+        value_out = max([row[4] for row in rows if row[4] is not None] or [0])
+        value = max([row[3]+row[4] for row in rows
+                     if row[3] is not None and row[4] is not None] or [0])
+        return filename, description, value, value_in, value_out
+    value_in = value_out = 0.0
+    cum = list(sum_rows(rows, start=int(data[0][:10])))
+    # rate of last compressed row can apply after end
+    while len(cum) > 1 and cum[-2][0] >= end:
+        cum.pop()
+    if len(cum) > 1 and cum[-1][0] > end:
+        (t0, in0, out0), (t1, in1, out1) = cum[-2:]
+        frac = (end-t0)/float(t1-t0)
+        cum[-1] = (end, in0+(in1-in0)*frac, out0+(out1-out0)*frac)
+    if cum:
+        value_in, value_out = cum[-1][1], cum[-1][2]
+    if metric == "avg":
+        value_in /= float(max(end-start, 1))
+        value_out /= float(max(end-start, 1))
+    return filename, description, value_in+value_out, value_in, value_out
+
+
+def top(paths, count=20, start=None, end=None, metric="avg", jobs=1):
+    '''
+    Find count busiest logfiles. Files are scanned in order of upper
+    bounds from daily summaries and scan stops when no other file can
+    get to the top. Return list of (filename, description, value, in, out).
+    '''
+    import functools
+    import multiprocessing
+    if metric not in ("avg", "max", "total"):
+        raise ValueError("Unknown metric: %s" % metric)
+    if end is None:
+        end = long(time.time())
+    if start is None:
+        start = end - grouper.one_day
+    tasks = []
+    for task in top_tasks(paths):
+        bound = top_bound(task[0], start, end, metric)
+        tasks.append((float("inf") if bound is None else bound, task))
+    tasks.sort(key=lambda x: x[0], reverse=True)
+    func = functools.partial(top_value, start=start, end=end, metric=metric)
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.get_context("fork").Pool(jobs)
+    chunk = max(jobs, 1)*4
+    ret = []
+    scanned = 0
+    for pos in range(0, len(tasks), chunk):
+        if len(ret) >= count and ret[count-1][2] >= tasks[pos][0]:
+            break  # no other file can get to the top
+        batch = [task for bound, task in tasks[pos:pos+chunk]]
+        results = pool.map(func, batch) if pool else map(func, batch)
+        ret.extend(result for result in results if result[2] is not None)
+        ret.sort(key=lambda x: x[2], reverse=True)
+        del ret[count:]
+        scanned += len(batch)
+    if pool:
+        pool.close()
+        pool.join()
+    if VERBOSE:
+        print("Scanned %d of %d files" % (scanned, len(tasks)))
+    return ret
+
+
+def maintain_log(task, filter_time="", filter_value="",
+                 force_compress=False):
+    '''
+    Compress, filter or merge one logfile. Return (filename, size, error).
+    '''
+    filename, merge = task
+    if merge and not os.path.exists(merge):
+        merge = None  # nothing to merge
+    try:
+        size = header = 0
+        if os.path.exists(filename):
+            size = os.path.getsize(filename)
+            with open(filename, "rb") as f:
+                header = f.readline()
+        elif not merge:
+            raise IOError("Missing logfile: %s" % filename)
+        if header and b"\t" in header:
+            lf = logfile_simple(
+                filename, tuple(header.decode("utf8").rstrip("\n").split("\t")),
+                force_compress or bool(merge)
+            )
+        else:
+            lf = logfile(filename, force_compress or bool(merge))
+        lf.filter_time(filter_time).filter_value(filter_value)
+        if merge:
+            lf.merge(merge)
+        lf.save()
+    except Exception as err:
+        return filename, 0, "%s: %s" % (err.__class__.__name__, err)
+    return filename, size, None
+
+
+def maintain(paths, jobs=1, merge_dir=None, **kwargs):
+    '''
+    Run maintenance of logfiles in process pool, report progress,
+    throughput and failures.
+    '''
+    import functools
+    import multiprocessing
+    tasks = maintenance_tasks(paths, merge_dir)
+    func = functools.partial(maintain_log, **kwargs)
+    if jobs > 1:
+        pool = multiprocessing.get_context("fork").Pool(jobs)
+        results = pool.imap_unordered(func, tasks, chunksize=8)
+    else:
+        pool = None
+        results = map(func, tasks)
+    start = last = time.time()
+    done = size = 0
+    failures = []
+    for filename, bytes, error in results:
+        done += 1
+        size += bytes
+        if error:
+            failures.append((filename, error))
+        now = time.time()
+        if not QUIET and (now-last >= 1 or done == len(tasks)):
+            last = now
+            elapsed = max(now-start, 1e-6)
+            print("%d/%d files, %d failed, %.1f files/s, %.1f MB/s"
+                  % (done, len(tasks), len(failures), done/elapsed,
+                     size/elapsed/1e6))
+    if pool:
+        pool.close()
+        pool.join()
+    for filename, error in failures:
+        print("FAILED: %s: %s" % (filename, error))
+    return failures
+
+
+def filter_options():
     filter_time = filter_value = ""
     if "--filter-time" in opts:
         filter_time = opts["--filter-time"][0]
@@ -1455,186 +5087,73 @@ def process_configs(files):
             ])
     if "--filter-value" in opts:
         filter_value = opts["--filter-value"][0]
-    force_compress = ('-z' in opts) or ('--compress' in opts)
-    entry = opts.get("--entry", ["Octets"])[0]
-    for fn in files:
-        if '@' in fn:
-            community, fn = fn.split('@', 1)
-        else:
-            community = 'public'
-        if not os.path.exists(fn):
-            print("Configuration file doesn't exist [%s]!" % fn)
-            continue
-        # update env
-        if "PATH" in os.environ:
-            os.environ["PATH"] += ":/sbin:/usr/sbin"
-        # load config
-        cfg = json.load(open(fn))
-        prefix = os.path.dirname(fn)
-        if "prefix" in cfg:
-            prefix = cfg["prefix"]
-        ps = pd = None
-        if "--local" in opts:
-            tdir = os.path.dirname(os.path.realpath(fn))
-            update_local(
-                cfg, tdir, force_compress,
-                filter_time=filter_time, filter_value=filter_value
-            )
-        elif "--merge-dir" in opts:
-            tdir = os.path.dirname(os.path.realpath(fn))
-            merge_logfiles(cfg, tdir, opts["--merge-dir"][0])
-            sys.exit()
-        elif "cmd_type" in cfg:
-            if cfg["cmd_type"] == "sh":
-                for rowid, row in cfg["ifs"].items():
-                    value = os.popen(row["cmd"]).read().strip()
-                    try:
-                        lf = logfile_simple(
-                            os.path.join(prefix, row["log"]),
-                            (row["cmd"], "-", "-", row.get("unit", "-")),
-                            force_compress=force_compress
-                        ).filter_time(filter_time).filter_value(filter_value)
-                        lf.update_valid(value)
-                    except LockError as err:
-                        print(err)
-            elif cfg["cmd_type"] == "ipset":
-                ps = ipset(cfg["cmd_src"])
-                pd = ipset(cfg["cmd_dst"])
-            elif cfg["cmd_type"] == "iptables":
-                ps = iptables_dst(cfg["cmd_dst"])
-                pd = iptables_src(cfg["cmd_src"])
-            elif cfg["cmd_type"] == "nftables":
-                ps = nftables_set(cfg["cmd_dst"])
-                pd = nftables_set(cfg["cmd_src"])
-            elif cfg["cmd_type"] == "netdev":
-                ps = proc_net_dev("rx", cfg["net_dev_filename"])
-                pd = proc_net_dev("tx", cfg["net_dev_filename"])
-            elif cfg["cmd_type"] == "json":
-                data = json.loads(fread(cfg["json"], prefix=prefix))
-                for rowid, row in cfg["ifs"].items():
-                    value = select_by_key(data, row["selector"])
-                    try:
-                        lf = logfile_simple(
-                            os.path.join(prefix, row["log"]),
-                            (row["selector"], "-", "-", row.get("unit", "-")),
-                            force_compress=force_compress
-                        ).filter_time(filter_time).filter_value(filter_value)
-                        lf.update_valid(value)
-                    except LockError as err:
-                        print(err)
-            elif cfg["cmd_type"] == "files":
-                max_age = int(cfg.get("max_age", 0))
-                for cmd_name, cmd in cfg["ifs"].items():
-                    try:
-                        if "file" in cmd:
-                            if max_age > 0:
-                                file_age = time.time() - \
-                                    os.stat(os.path.join(
-                                        prefix, cmd["file"])).st_mtime
-                                if file_age > max_age:
-                                    print("Data file %s older than %d seconds for '%s'."
-                                          % (cmd["file"], file_age, cmd.get("ifDescr", "")))
-                                    continue
-                            fc = open(os.path.join(prefix, cmd["file"])
-                                      ).read().strip()
-                            if fc:
-                                lf = logfile_simple(
-                                    os.path.join(prefix, cmd["log"]),
-                                    (cmd["file"], "-", "-", "-"),
-                                    force_compress=force_compress
-                                ).filter_time(filter_time).filter_value(filter_value)
-                                lf.update_valid(open(os.path.join(prefix, cmd["file"])
-                                                    ).read().strip())
-                        elif "file2" in cmd:
-                            if max_age > 0:
-                                file_age = time.time() - \
-                                    os.stat(os.path.join(
-                                        prefix, cmd["file"])).st_mtime
-                                if file_age > max_age:
-                                    print("Data file %s older than %d seconds for '%s'."
-                                          % (cmd["file"], file_age, cmd.get("ifDescr", "")))
-                                    continue
-                            fc = open(os.path.join(prefix, cmd["file2"])
-                                      ).read().strip().split()
-                            if fc:
-                                lf = logfile(os.path.join(prefix, cmd["log"])
-                                             ).filter_time(filter_time).filter_value(filter_value)
-                                ps, pd = [
-                                    float(x)
-                                    for x in open(os.path.join(prefix, cmd["file2"])
-                                                  ).read().strip().split()
-                                ]
-                                lf.update(ps, pd)
-                    except LockError as err:
-                        print(err)
-            elif cfg["cmd_type"] == "key_value":
-                data = dict([
-                    x.split(": ", 1)
-                    for x in nsplit(fread(cfg["data_url"]))
-                    if ": " in x
-                ])
-                for rowid, row in cfg["ifs"].items():
-                    value = data[row["data_key"]]
-                    try:
-                        lf = logfile_simple(
-                            os.path.join(prefix, row["log"]),
-                            (row["data_key"], "-", "-", row.get("unit", "-")),
-                            force_compress=force_compress
-                        ).filter_time(filter_time).filter_value(filter_value)
-                        lf.update_valid(value)
-                    except LockError as err:
-                        print(err)
-            elif cfg["cmd_type"] == "pid_cpu_usage":
-                usages = pid_cpu_usage()
-                for cmd_name, cmd in cfg["ifs"].items():
-                    try:
-                        lf = logfile(os.path.join(prefix, cmd["log"]))
-                        usage = usages.cpu_usage(cmd["re_cmd"])
-                        if usage:
-                            lf.update(usage[2]+usage[3], usage[0]+usage[1])
-                    except LockError as err:
-                        print(err)
-            else:
-                print("Unknown command type:", cfg["cmd_type"])
-            if ps and pd:
-                list(ps.items()), list(pd.items())  # load object
-                for ip in cfg["ifs"].values():
-                    ipid = ip['ifName']
-                    #print(ip['ifName'], pd.bytes[ipid], ps.bytes[ipid])
-                    try:
-                        lf = logfile(os.path.join(prefix, ip['log'])
-                                     ).filter_time(filter_time).filter_value(filter_value)
-                        if ipid in pd.bytes and ipid in ps.bytes:
-                            lf.update(pd.bytes[ipid], ps.bytes[ipid])
-                        elif not QUIET:
-                            print("Missing key:", ipid)
-                    except LockError as err:
-                        print(err)
-        else:
-            tdir = os.path.dirname(os.path.realpath(fn))
-            if 'ifs' in cfg:
-                update_io(
-                    cfg, tdir, community, suffix=cfg.get("entry", entry),
-                    force_compress=force_compress,
-                    filter_time=filter_time, filter_value=filter_value
-                )
-            elif 'oids' in cfg:
-                update_value(
-                    cfg, tdir, community, force_compress=force_compress,
-                    filter_time=filter_time, filter_value=filter_value
-                )
-            else:
-                print("Missing ifs or oids in cfg file!")
+    return filter_time, filter_value
+
+
+def process_configs(files):
+    filter_time, filter_value = filter_options()
+    kwargs = dict(
+        filter_time=filter_time,
+        filter_value=filter_value,
+        force_compress=('-z' in opts) or ('--compress' in opts),
+        entry=opts.get("--entry", ["Octets"])[0]
+    )
+    jobs = int(opts.get("--jobs", opts.get("-j", [1]))[0])
+    deadline = float(opts.get("--deadline", [0])[0])
+    if "--merge-dir" in opts:
+        # configs one by one, logfiles of each config are merged in parallel
+        for fn in files:
+            process_config(fn, **kwargs)
+        return
+    if "--daemon" in opts:
+        daemon(
+            files, int(opts.get("--interval", [60])[0]),
+            int(opts.get("--jobs", opts.get("-j", [8]))[0]),
+            deadline, **kwargs
+        )
+        return
+    if SNMP_ENGINE == "asyncio":
+        timing = process_configs_async(files, deadline, **kwargs)
+        if not QUIET and (jobs > 1 or deadline):
+            print_timing(timing)
+        return
+    if jobs <= 1 and not deadline:
+        for fn in files:
+            process_config(fn, **kwargs)
+        return
+    # worker pool, each config is processed in separate process
+    import multiprocessing
+    pool = multiprocessing.get_context("fork").Pool(max(jobs, 1))
+    results = [
+        (fn, pool.apply_async(process_config_timed, (fn, deadline), kwargs))
+        for fn in files
+    ]
+    pool.close()
+    timing = []
+    for fn, result in results:
+        try:
+            timing.append(result.get())
+        except Exception as err:
+            timing.append((fn, None, "ERROR: %s" % err))
+    pool.join()
+    if not QUIET:
+        print_timing(timing)
 
 
 if __name__ == "__main__":
-    gopts, files = getopt.gnu_getopt(sys.argv[1:], 'hctzw:dvq', [
+    gopts, files = getopt.gnu_getopt(sys.argv[1:], 'hctzw:dvqj:', [
         'help', 'mkcfg', 'test', 'write=', 'mkdir', 'id=', 'rename',
         'verbose', 'quiet', 'check', 'backup', 'insecure',
         'merge-dir=', 'filter=', 'filter-time=', 'filter-value=',
         'local', 'entry=', 'sensors-cisco', 'sensors-huawei',
         'iptables', 'ipset', 'nft',
-        'netdev', 'hwmon', 'files', 'cmd', 'override='
+        'netdev', 'hwmon', 'files', 'cmd', 'override=',
+        'jobs=', 'deadline=', 'engine=', 'bench', 'bulk',
+        'daemon', 'interval=', 'journal=', 'storage=', 'bench-storage',
+        'recompact', 'maintain', 'compact-budget=', 'compact-max=',
+        'index', 'precompress', 'gzip', 'brotli', 'serve', 'listen=',
+        'export', 'from=', 'to=', 'since=', 'step=', 'agg=', 'points=',
+        'column=', 'total', 'sum', 'top=', 'metric='
     ])
 
     opts = defaultdict(list)
@@ -1649,11 +5168,35 @@ if __name__ == "__main__":
         BACKUP = True
     if "--insecure" in opts:
         INSECURE = True
+    if "--engine" in opts:
+        SNMP_ENGINE = opts["--engine"][0]
+    if "--bulk" in opts:
+        SNMP_BULK = True
+    if "--journal" in opts:
+        JOURNAL = int(opts["--journal"][0])
+    if "--storage" in opts:
+        STORAGE = opts["--storage"][0]
+    if "--index" in opts:
+        LOG_INDEX = True
+    if "--sum" in opts:
+        LOG_SUM = True
+    if "--gzip" in opts:
+        PRECOMPRESS.append("gz")
+    if "--brotli" in opts:
+        PRECOMPRESS.append("br")
+    if "--compact-budget" in opts:
+        COMPACT_BUDGET = float(opts["--compact-budget"][0])
+    if "--compact-max" in opts:
+        COMPACT_MAX = int(opts["--compact-max"][0])
     if "--override" in opts:
         for opt in opts["--override"]:
             key, value = opt.split(":", 1)
             CONFIG_OVERRIDE[key] = value
-    if not files:
+    if "--serve" in opts:
+        # directory is optional, current directory is served by default
+        serve((files or ["."])[0],
+              opts.get("--listen", ["127.0.0.1:8000"])[0])
+    elif not files:
         print(__doc__)
         sys.exit()
     elif "--mkcfg" in opts or "-c" in opts:
@@ -1681,15 +5224,17 @@ if __name__ == "__main__":
             print("Connecting to: %s@%s [%s]" % (community, name, log_prefix))
         ret = {}
         if "--entry" in opts:
-            ret["entry"] = opts["--entry"][0]
+            ret["entry"] = entries(opts["--entry"][0])
+            if len(ret["entry"]) == 1:
+                ret["entry"] = ret["entry"][0]
         if "--sensors-cisco" in opts:
-            result = SNMP(name, community).get_sensors_cisco()
+            result = snmp_connect(name, community).get_sensors_cisco()
             ret['oids'] = result
         elif "--sensors-huawei" in opts:
-            result = SNMP(name, community).get_sensors_huawei()
+            result = snmp_connect(name, community).get_sensors_huawei()
             ret['oids'] = result
         else:
-            result = SNMP(name, community).get_info(
+            result = snmp_connect(name, community).get_info(
                 ifid, log_prefix, filter=iffilter)
             ret['ifs'] = result
         try:
@@ -1781,6 +5326,84 @@ if __name__ == "__main__":
         cfg = cmd_mkindex(files)
         print(json.dumps(cfg, indent=2))
     elif "--test" in opts or "-t" in opts:
-        print(SNMP(files[0]).getall(files[1:]))
+        snmpc = snmp_connect(files[0])
+        start = time.time()
+        print(snmpc.getall(files[1:], bulk=SNMP_BULK))
+        if VERBOSE:
+            print("%d requests in %.3fs"
+                  % (snmpc.requests, time.time()-start))
+    elif "--maintain" in opts:
+        filter_time, filter_value = filter_options()
+        failures = maintain(
+            files, int(opts.get("--jobs", opts.get("-j", [1]))[0]),
+            opts.get("--merge-dir", [None])[0],
+            filter_time=filter_time, filter_value=filter_value,
+            force_compress=('-z' in opts) or ('--compress' in opts)
+        )
+        if failures:
+            sys.exit(1)
+    elif "--recompact" in opts:
+        for path in files:
+            recompact_dir(path)
+    elif "--precompress" in opts:
+        for path in files:
+            precompress_dir(path, ["gz"]+PRECOMPRESS)
+    elif "--export" in opts:
+        params = dict((key, opts["--"+key][0])
+                      for key in ("from", "to", "since", "step", "agg",
+                                  "points", "column")
+                      if "--"+key in opts)
+        if params.get("column", "i") not in ("i", "o", "I", "O"):
+            sys.exit("ERROR: Unknown column: %s, use i, o, I or O"
+                     % params["column"])
+        for filename in files:
+            try:
+                data = query_log(filename, params)
+            except (ValueError, OverflowError) as err:
+                sys.exit("ERROR: %s" % err)
+            if data is None:
+                print("ERROR: Not a trafgrapher logfile: %s" % filename)
+                sys.exit(1)
+            sys.stdout.write(data.decode("utf8"))
+    elif "--total" in opts:
+        start = end = None
+        if "--from" in opts:
+            start = parse_time(opts["--from"][0])
+        if "--to" in opts:
+            end = parse_time(opts["--to"][0])
+        for filename in files:
+            total = read_total(filename, start, end)
+            if total is None:
+                print("%s: unsupported" % filename)
+                continue
+            total_in, total_out = total
+            print("%s: in %d B (%s), out %d B (%s)" % (
+                filename, total_in, ifspeed(total_in, "B"),
+                total_out, ifspeed(total_out, "B")))
+    elif "--top" in opts:
+        start = end = None
+        if "--from" in opts:
+            start = parse_time(opts["--from"][0])
+        if "--to" in opts:
+            end = parse_time(opts["--to"][0])
+        metric = opts.get("--metric", ["avg"])[0]
+        unit = "B" if metric == "total" else "B/s"
+        result = top(
+            files, int(opts["--top"][0]), start, end, metric,
+            int(opts.get("--jobs", opts.get("-j", [1]))[0])
+        )
+        for rank, (filename, description, value, value_in, value_out) \
+                in enumerate(result, 1):
+            print("%3d. %-12s in %-12s out %-12s %s %s" % (
+                rank, ifspeed(value, unit), ifspeed(value_in, unit),
+                ifspeed(value_out, unit), description, filename))
+    elif "--bench-storage" in opts:
+        benchmark_storage(files)
+    elif "--bench" in opts:
+        if "@" in files[0]:
+            community, name = files[0].split("@", 1)
+        else:
+            community, name = "public", files[0]
+        benchmark_snmp(name, files[1:], community)
     else:
         process_configs(files)
@@ -6,6 +6,7 @@
 
 var trafgrapher_version = '3.4.0',
     one_hour = 3600000,
+    rollup_rows = 1500, // default number of rows in rollup files
     last_reload = null,
     degreeC = "℃";
 
@@ -25,6 +26,13 @@ function col0diff(a, b) {
   return a[0]-b[0];
 }
 
+// Convert null values of JSON rows to NaN, same as missing values in logs.
+function null2nan(rows) {
+  return rows.map(function(cols) {
+    return cols.map(function(col) { return col===null ? NaN : col; });
+  });
+}
+
 // Join two arrays into one. For same keys sum values.
 function joinarrays(arr) {
   var d = {}, i, key;
@@ -524,7 +532,7 @@ Graph.prototype.add_plot_callbacks = function(placeholder) {
     self.range_from = ranges.xaxis.from;
     self.range_to = ranges.xaxis.to;
     self.plot.clearSelection();
-    self.plot_all_graphs();
+    self.plot_range();
     self.urllink();
   });
 }
@@ -648,7 +656,7 @@ Graph.prototype.add_menu_callbacks = function () {
   this.find("b_select_virt").click(function () { self.select_virt(); });
   this.find("b_select_zero").click(function () { self.select_value(); });
   this.find("b_zoom_out").click(function () { self.zoom_out(); });
-  this.find("b_reload").click(function () { self.refresh_graph(); });
+  this.find("b_reload").click(function () { self.reload_graph(); });
   this.find("b_urllink").click(function () { self.urllink(); });
 }
 
@@ -768,7 +776,7 @@ Graph.prototype.keyevent = function(event) {
       this.select_virt();
       break;
     case 'R'.charCodeAt(0):
-      this.refresh_graph();
+      this.reload_graph();
       break;
     case 'Z'.charCodeAt(0):
       this.zoom_out();
@@ -816,19 +824,19 @@ Graph.prototype.keyevent = function(event) {
       this.custom_range = true;
       this.range_from += this.interval.val()*one_hour;
       this.range_to += this.interval.val()*one_hour;
-      this.plot_all_graphs();
+      this.plot_range();
       break;
     case 37: // left
       this.custom_range = true;
       this.range_from -= this.interval.val()*one_hour;
       this.range_to -= this.interval.val()*one_hour;
-      this.plot_all_graphs();
+      this.plot_range();
       break;
     case 38: // up
       this.custom_range = true;
       this.range_from -= this.interval.val()*one_hour;
       this.range_to += this.interval.val()*one_hour;
-      this.plot_all_graphs();
+      this.plot_range();
       break;
     case 40: // down
       var amount = this.interval.val()*one_hour;
@@ -836,7 +844,7 @@ Graph.prototype.keyevent = function(event) {
         this.custom_range = true;
         this.range_from += amount;
         this.range_to -= amount;
-        this.plot_all_graphs();
+        this.plot_range();
       }
       break;
     default:
@@ -1093,7 +1101,42 @@ Graph.prototype.plot_graph = function(checked_choices, placeholder) {
 
 Graph.prototype.refresh_range = function () {
   this.reset_range();
-  if (this.index_mode=="storage")
+  if (this.index_mode=="storage" || this.rollups_changed())
+    this.refresh_graph();
+  else
+    this.plot_all_graphs();
+}
+
+// Select smallest rollup file covering current range.
+// Rollups are defined in index.json as {"name": step_in_seconds, ...}.
+Graph.prototype.select_rollup = function (rollups, rows) {
+  var selected = null, step = Infinity,
+      needed = Number(new Date()) - this.range_from;
+  if (!rollups) return null;
+  for (var name in rollups) {
+    if (rollups[name]*(rows || rollup_rows)*1000 >= needed
+        && rollups[name]<step) {
+      selected = name;
+      step = rollups[name];
+    }
+  }
+  return selected;
+}
+
+// Check if loaded files use different rollup than current range needs.
+Graph.prototype.rollups_changed = function () {
+  for (var name in this.info) {
+    var info = this.info[name];
+    if (info.rollups &&
+        info.rollup!=this.select_rollup(info.rollups, info.rollup_rows))
+      return true;
+  }
+  return false;
+}
+
+// Plot current range, reload if other rollup files are required.
+Graph.prototype.plot_range = function () {
+  if (this.rollups_changed())
     this.refresh_graph();
   else
     this.plot_all_graphs();
@@ -1121,6 +1164,63 @@ Graph.prototype.refresh_graph = function () {
   if (loader) loader.reload();
 }
 
+// Reload graph, append only new rows from tail files if available.
+Graph.prototype.reload_graph = function () {
+  if (this.index_mode=="json" && this.tails && this.tails.length>0)
+    this.append_tails();
+  else
+    this.refresh_graph();
+}
+
+// Append rows from tail files of json indexes to loaded logs.
+// Reload all files, if tail does not cover time since last loaded row.
+Graph.prototype.append_tails = function () {
+  var self = this, tails = this.tails, pending = tails.length,
+      failed = false;
+  function done() {
+    if (--pending>0) return;
+    if (failed) {
+      self.refresh_graph();
+    } else {
+      if (self.custom_range===false) self.reset_range();
+      self.plot_range();
+    }
+  }
+  for (var i=0; i<tails.length; i++) (function(tail) {
+    $.ajax({
+      url: tail.url,
+      dataType: "json",
+      cache: false
+    }).done(function(data) {
+      for (var fni=0; fni<tail.files.length; fni++) {
+        var args = tail.files[fni], deltas = self.deltas[args.ethid],
+            rows = (data[args.section] || {})[args.port_id], last = 0;
+        if (!deltas || !rows) continue;
+        rows = null2nan(rows);
+        if (args.rollup || (args.json && args.json.counter)) {
+          failed = true;
+          continue;
+        }
+        if (deltas.i.length>0) last = deltas.i[deltas.i.length-1][0]/1000;
+        if (data.from>last) failed = true;
+        for (var rowi=0; rowi<rows.length; rowi++) {
+          var cols = rows[rowi], t = cols[0]*1000;
+          if (cols[0]<=last) continue;
+          deltas.i.push([t, cols[1]]);
+          deltas.j.push([t, -cols[1]]);
+          deltas.o.push([t, cols[2]]);
+          deltas.I.push([t, cols[3]]);
+          deltas.J.push([t, -cols[3]]);
+          deltas.O.push([t, cols[4]]);
+        }
+      }
+    }).fail(function() {
+      failed = true;
+    }).always(done);
+  })(tails[i]);
+  last_reload = new Date();
+}
+
 Graph.prototype.change_source = function () {
   // Remove checkboxes, because new source has different checkboxes.
   this.filter.empty();
@@ -1130,7 +1230,7 @@ Graph.prototype.change_source = function () {
 Graph.prototype.zoom_out = function () {
   // Reset zoom
   this.reset_range();
-  this.plot_all_graphs();
+  this.plot_range();
   this.urllink();
 }
 
@@ -1309,6 +1409,7 @@ Loader = function(graph, index_files) {
   this.counters = {};
   graph.deltas = {};
   graph.info = {};
+  graph.tails = [];
   // set current interval
   if (!graph.range_from || !graph.range_to || graph.custom_range===false)
     graph.reset_range();
@@ -1374,14 +1475,16 @@ JSONLoader.prototype = Object.create(Loader.prototype);
 // Load log file.
 JSONLoader.prototype.load_log = function(filename, args) {
   var self = this;
+  // use rollup file if available
+  args.rollup = this.graph.select_rollup(args.rollups, args.rollup_rows);
+  if (args.rollup)
+    filename = filename.replace(/\.log$/, "."+args.rollup+".log");
   $.ajax({
     url: filename,
     dataType: "text",
     cache: false
   }).done(function(data) {
-    var ethid = args.ethid, lines = data.split('\n');
-    name = $('<div/>').text(args.name).html(); // escape html in name
-    var deltas = {'o': [], 'i': [], 'j': [], 'O': [], 'I': [], 'J': []};
+    var lines = data.split('\n');
     lines.shift(); // remove couter line
     lines = lines.filter(function(row) {
       return row[0]; // filter out empty values
@@ -1389,35 +1492,67 @@ JSONLoader.prototype.load_log = function(filename, args) {
       return row.split(" ").map(function(col) { return parseFloat(col); });
     });
     lines.sort(col0diff);
-    for (var line=0; line<lines.length; line++) {
-      var cols = lines[line];
-      var t = cols[0]*1000,
-          ib = cols[1], ob = cols[2],
-          im = cols[3], om = cols[4];
-      if (cols.length==2) {
-        deltas.o.push([t, ib]);
-      } else {
-        deltas.i.push([t, ib]);
-        deltas.j.push([t, -ib]);
-        deltas.o.push([t, ob]);
-        deltas.I.push([t, im]);
-        deltas.J.push([t, -im]);
-        deltas.O.push([t, om]);
-      }
-    }
-    if (args.json && args.json.counter)
-      for (var key in deltas)
-        deltas[key] = arraydelta(deltas[key], false);
-    self.graph.deltas[ethid] = deltas;
-    // create info and copy args
-    self.graph.info[ethid] = {name: ethid, unit: {b: 'ib/s', B: 'iB/s'}};
-    for (var key in args) self.graph.info[ethid][key] = args[key];
-    self.file_loaded();
+    self.add_log(lines, args);
   }).fail(function(jqXHR, textStatus, error) {
     self.progress.loading_error(filename, error);
   });
 }
 
+// Add rows of log file sorted by time to graph.
+JSONLoader.prototype.add_log = function(lines, args) {
+  var ethid = args.ethid;
+  name = $('<div/>').text(args.name).html(); // escape html in name
+  var deltas = {'o': [], 'i': [], 'j': [], 'O': [], 'I': [], 'J': []};
+  for (var line=0; line<lines.length; line++) {
+    var cols = lines[line];
+    var t = cols[0]*1000,
+        ib = cols[1], ob = cols[2],
+        im = cols[3], om = cols[4];
+    if (cols.length==2) {
+      deltas.o.push([t, ib]);
+    } else {
+      deltas.i.push([t, ib]);
+      deltas.j.push([t, -ib]);
+      deltas.o.push([t, ob]);
+      deltas.I.push([t, im]);
+      deltas.J.push([t, -im]);
+      deltas.O.push([t, om]);
+    }
+  }
+  if (args.json && args.json.counter)
+    for (var key in deltas)
+      deltas[key] = arraydelta(deltas[key], false);
+  this.graph.deltas[ethid] = deltas;
+  // create info and copy args
+  this.graph.info[ethid] = {name: ethid, unit: {b: 'ib/s', B: 'iB/s'}};
+  for (var key in args) this.graph.info[ethid][key] = args[key];
+  this.file_loaded();
+}
+
+// Load all logs of json index from one bundle file.
+// Logs missing in bundle or using rollup files are loaded separately.
+JSONLoader.prototype.load_bundle = function(url, files) {
+  var self = this;
+  $.ajax({
+    url: url,
+    dataType: "json",
+    cache: false
+  }).done(function(data) {
+    for (var fni=0; fni<files.length; fni++) {
+      var args = files[fni], section = data[args.section] || {},
+          rows = section[args.port_id];
+      args.rollup = self.graph.select_rollup(args.rollups, args.rollup_rows);
+      if (rows && !args.rollup)
+        self.add_log(null2nan(rows), args);
+      else
+        self.load_log(args.filename, args);
+    }
+  }).fail(function(jqXHR, textStatus, error) {
+    for (var fni=0; fni<files.length; fni++)
+      self.load_log(files[fni]["filename"], files[fni]);
+  });
+}
+
 // Load json index and start loading of files.
 JSONLoader.prototype.load_index = function(url) {
   var self = this;
@@ -1476,7 +1611,10 @@ JSONLoader.prototype.load_index = function(url) {
           'ethid': ethid,
           'name': get_if_name(data.ifs),
           'ip': data.ip,
-          'json': data.ifs[port_id]
+          'json': data.ifs[port_id],
+          'section': 'ifs',
+          'rollups': data.rollups,
+          'rollup_rows': data.rollup_rows
         });
         if (preselect_graphs.length>0) {
           if ($.inArray(port_id, preselect_graphs)>=0)
@@ -1497,7 +1635,8 @@ JSONLoader.prototype.load_index = function(url) {
           'port_id': oid,
           'name': data_oid.description || data_oid.name,
           'ip': data.ip,
-          'json': data_oid
+          'json': data_oid,
+          'section': 'oids'
         });
         if (preselect_graphs.length>0) {
           if ($.inArray(oid, preselect_graphs)>=0)
@@ -1506,6 +1645,15 @@ JSONLoader.prototype.load_index = function(url) {
       }
     }
     self.progress.add(files.length, data.length);
+    if (data.tail)
+      self.graph.tails.push({
+        url: url.replace(/\.json$/, "")+".tail.json",
+        files: files
+      });
+    if (data.bundle) {
+      self.load_bundle(url.replace(/\.json$/, "")+".bundle.json", files);
+      return;
+    }
     for (var fni=0; fni<files.length; fni++)
       self.load_log(files[fni]["filename"], files[fni]);
   }).fail(function(jqXHR, textStatus, error) {
@@ -0,0 +1,45 @@
+'''
+Synthetic trafgrapher logfiles for tests.
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bin"))
+
+import trafgrapher  # noqa: E402
+
+
+def tier_times(now, days, raw_step=60):
+    '''
+    Times of rows of compressed logfile with days of history, newest
+    first. Rows of last 10 minutes are raw, older rows are keyed by
+    start of grouper interval.
+    '''
+    times = []
+    t = now
+    while now-t < 600:
+        times.append(t)
+        t -= raw_step
+    for limit, step in sorted(trafgrapher.grouper.compress_intervals.items()):
+        if limit <= 600:
+            continue
+        step = int(step)
+        t = t//step*step
+        while now-t < min(limit, days*86400):
+            times.append(t)
+            t -= step
+    return times
+
+
+def write_log(filename, rows, counter=None):
+    '''
+    Write text logfile with (time, in, out, max in, max out) rows
+    in given order.
+    '''
+    counter = counter or (rows[0][0], 0, 0)
+    with open(filename, "w") as f:
+        f.write(trafgrapher.logfile.header_format % tuple(counter))
+        for row in rows:
+            f.write(" ".join(
+                "N" if x is None else "%d" % x for x in row) + "\n")
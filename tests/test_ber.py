@@ -0,0 +1,102 @@
+import unittest
+
+from logdata import trafgrapher
+
+
+class test_ber(unittest.TestCase):
+
+    def test_length(self):
+        for length in (0, 1, 0x7f, 0x80, 0xff, 0x100, 300, 70000):
+            data = bytes(range(256))*(length//256) + bytes(length % 256)
+            encoded = trafgrapher.ber_encode(trafgrapher.BER_OCTET_STRING,
+                                             data)
+            self.assertEqual(trafgrapher.ber_decode(encoded),
+                             (trafgrapher.BER_OCTET_STRING, data,
+                              len(encoded)))
+
+    def test_truncated(self):
+        encoded = trafgrapher.ber_encode(trafgrapher.BER_OCTET_STRING,
+                                         b"x"*200)
+        self.assertRaises(ValueError, trafgrapher.ber_decode, encoded[:-1])
+
+    def test_integer(self):
+        for value in (0, 1, 127, 128, 255, 256, -1, -128, -129,
+                      2**31-1, 2**31, -2**31, 2**63):
+            tag, data, pos = trafgrapher.ber_decode(
+                trafgrapher.ber_integer(value))
+            self.assertEqual(tag, trafgrapher.BER_INTEGER)
+            self.assertEqual(trafgrapher.snmp_value(tag, data), str(value))
+
+    def test_oid(self):
+        for oid in ("1.3.6.1.2.1.2.2.1.10.1",
+                    "1.3.6.1.2.1.31.1.1.1.6.4294967295",
+                    "1.3.6.1.4.1.2011.5.25.31.1.1.1.1.11.16777216",
+                    "1.3.6.1.4.1.9.127.128.16383.16384"):
+            tag, data, pos = trafgrapher.ber_decode(trafgrapher.ber_oid(oid))
+            self.assertEqual(tag, trafgrapher.BER_OID)
+            self.assertEqual(trafgrapher.ber_decode_oid(data), oid)
+            self.assertEqual(trafgrapher.snmp_value(tag, data), "."+oid)
+
+    def test_values(self):
+        for tag, data, value in [
+                (0x41, b"\x00\xff\xff\xff\xff", "4294967295"),
+                (0x46, b"\x00\x80" + bytes(7), str(2**63)),
+                (0x43, b"\x01\x00", "256"),
+                (trafgrapher.BER_IPADDRESS, b"\x0a\x00\x00\xfe", "10.0.0.254"),
+                (trafgrapher.BER_OCTET_STRING, b"eth0", "eth0"),
+                (trafgrapher.BER_NULL, b"", None),
+                (trafgrapher.SNMP_END_OF_MIB, b"", None)]:
+            self.assertEqual(trafgrapher.snmp_value(tag, data), value)
+
+    def test_binary_string(self):
+        # bytes which are valid utf8 must be kept as bytes
+        mac = b"\x00\x11\xc3\xa9\x44\x55"
+        value = trafgrapher.snmp_value(trafgrapher.BER_OCTET_STRING, mac)
+        self.assertEqual(len(value), len(mac))
+        self.assertEqual(trafgrapher.macaddr(value), "00:11:c3:a9:44:55")
+
+    def test_message(self):
+        oids = ["1.3.6.1.2.1.2.2.1.10.1", "1.3.6.1.2.1.2.2.1.16.1"]
+        tag, message, pos = trafgrapher.ber_decode(trafgrapher.snmp_message(
+            b"public", trafgrapher.SNMP_GETBULK, 12345, oids, 0, 25))
+        self.assertEqual(tag, trafgrapher.BER_SEQUENCE)
+        version, community, (pdu_type, pdu) = \
+            list(trafgrapher.ber_items(message))
+        self.assertEqual(community, (trafgrapher.BER_OCTET_STRING, b"public"))
+        self.assertEqual(pdu_type, trafgrapher.SNMP_GETBULK)
+        fields = list(trafgrapher.ber_items(pdu))
+        self.assertEqual([trafgrapher.snmp_value(tag, value)
+                          for tag, value in fields[:3]], ["12345", "0", "25"])
+        self.assertEqual([
+            trafgrapher.ber_decode_oid(list(trafgrapher.ber_items(
+                varbind))[0][1])
+            for tag, varbind in trafgrapher.ber_items(fields[3][1])], oids)
+
+    def test_response(self):
+        varbinds = [
+            ("1.3.6.1.2.1.2.2.1.10.1", 0x41, b"\x00\xff\xff\xff\xfe"),
+            ("1.3.6.1.2.1.2.2.1.6.1", trafgrapher.BER_OCTET_STRING,
+             b"\x00\x11\xc3\xa9\x44\x55"),
+            ("1.3.6.1.2.1.2.2.1.10.2", trafgrapher.SNMP_END_OF_MIB, b"")]
+        data = trafgrapher.ber_encode(
+            trafgrapher.BER_SEQUENCE,
+            trafgrapher.ber_integer(1)
+            + trafgrapher.ber_encode(trafgrapher.BER_OCTET_STRING, b"public")
+            + trafgrapher.ber_encode(
+                trafgrapher.SNMP_RESPONSE,
+                trafgrapher.ber_integer(7) + trafgrapher.ber_integer(0)
+                + trafgrapher.ber_integer(0)
+                + trafgrapher.ber_encode(trafgrapher.BER_SEQUENCE, b"".join(
+                    trafgrapher.ber_encode(
+                        trafgrapher.BER_SEQUENCE, trafgrapher.ber_oid(oid)
+                        + trafgrapher.ber_encode(tag, value))
+                    for oid, tag, value in varbinds))))
+        self.assertEqual(trafgrapher.snmp_response(data),
+                         (7, 0, 0, varbinds))
+        self.assertRaises(ValueError, trafgrapher.snmp_response,
+                          trafgrapher.snmp_message(
+                              b"public", trafgrapher.SNMP_GET, 7, ["1.3"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
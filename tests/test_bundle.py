@@ -0,0 +1,49 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from logdata import trafgrapher, write_log
+
+
+class test_bundle(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config_file = os.path.join(self.tmpdir, "index.json")
+        self.cfg = {"ifs": {"1": {"log": "a_1.log"}}}
+        self.now = 1790000000
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, name):
+        with open(trafgrapher.bundle_name(self.config_file, name)) as f:
+            return json.load(f)
+
+    def test_journal(self):
+        write_log(os.path.join(self.tmpdir, "a_1.log"),
+                  [(self.now-60*i, 1, 2, 3, 4) for i in range(10)],
+                  (self.now, 10**6, 2*10**6))
+        # rows not fanned out to logfile yet
+        jrnl = trafgrapher.journal(trafgrapher.journal_name(self.config_file))
+        for i in (1, 2):
+            jrnl.append(self.now+60*i, 10**6+6000*i, {"1": {
+                "ifInOctets": 10**6+6000*i, "ifOutOctets": 2*10**6+12000*i}})
+        trafgrapher.write_bundle(self.cfg, self.tmpdir, self.config_file)
+        rows = self.read("bundle")["ifs"]["1"]
+        self.assertEqual(len(rows), 12)
+        self.assertEqual([row[0] for row in rows],
+                         sorted(row[0] for row in rows))
+        self.assertEqual(rows[-2][:3], [self.now+60, 100, 200])
+        self.assertEqual(rows[-1][:3], [self.now+120, 100, 200])
+        trafgrapher.write_bundle(self.cfg, self.tmpdir, self.config_file,
+                                 self.now+90, "tail")
+        tail = self.read("tail")
+        self.assertEqual(tail["from"], self.now+90)
+        self.assertEqual([row[0] for row in tail["ifs"]["1"]], [self.now+120])
+
+
+if __name__ == "__main__":
+    unittest.main()
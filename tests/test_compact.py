@@ -0,0 +1,147 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from logdata import trafgrapher, tier_times, write_log
+
+
+def random_rows(rnd, times, unknown=0):
+    '''
+    Return rows with random values for times, unknown is probability
+    of unknown value.
+    '''
+    return [(t,) + tuple(
+        None if rnd.random() < unknown else rnd.randrange(10**7)
+        for i in range(4)) for t in times]
+
+
+def sparse_times(rnd, now, days):
+    '''
+    Times of raw rows with random gaps, newest first.
+    '''
+    times = []
+    t = now
+    while now-t < days*86400:
+        times.append(t)
+        t -= rnd.choice([59, 60, 61, 120, 1000, 7200, 86400, 30*86400])
+    return times
+
+
+def expected(rows, start):
+    '''
+    Rows compressed by grouper.load() as text lines.
+    '''
+    deltas = dict((row[0], row[1:]) for row in rows)
+    return [" ".join("N" if x is None else "%d" % x for x in [t]+vals)
+            for t, vals in sorted(
+                trafgrapher.grouper().load(deltas, start).items(),
+                reverse=True)]
+
+
+class test_compact(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "a.log")
+        self.now = 1790000000
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, filename):
+        with open(filename) as f:
+            return f.read()
+
+    def append(self, rows, counter):
+        with open(self.filename, "rb+") as f:
+            f.write((trafgrapher.logfile.header_format % counter).encode())
+            f.seek(0, 2)
+            for row in rows:
+                f.write((trafgrapher.logfile.data_format % row).encode())
+
+    def test_recompact_equals_save(self):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            self.skipTest("numpy is not available")
+        copy = self.filename+".copy"
+        for seed in range(20):
+            rnd = random.Random(seed)
+            now = self.now + rnd.randrange(14*86400)
+            # compressed rows, older than 4 years included
+            times = sparse_times(rnd, now-rnd.randrange(3*86400), 5*365)
+            write_log(self.filename, random_rows(rnd, times),
+                      (times[0], 0, 0))
+            # appended rows in ascending order, newer than compressed rows
+            appended = sorted(t for t in sparse_times(rnd, now, 2)
+                              if t > times[0])
+            self.append(random_rows(rnd, appended), (now, 0, 0))
+            shutil.copy(self.filename, copy)
+            rows = trafgrapher.recompact(self.filename)
+            trafgrapher.logfile(copy, True).save()
+            self.assertEqual(self.read(self.filename), self.read(copy))
+            self.assertEqual(rows, len(self.read(copy).splitlines())-1)
+
+    def test_recompact_unknown(self):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            self.skipTest("numpy is not available")
+        rnd = random.Random(1)
+        times = sparse_times(rnd, self.now, 100)
+        rows = random_rows(rnd, times, 0.7)
+        write_log(self.filename, rows)
+        trafgrapher.recompact(self.filename)
+        lines = self.read(self.filename).splitlines()
+        self.assertIn("N", " ".join(lines[1:]).split())
+        self.assertEqual(lines[1:], expected(rows, self.now))
+
+    def test_stream_equals_load(self):
+        rnd = random.Random(2)
+        times = sparse_times(rnd, self.now, 5*365)
+        rows = random_rows(rnd, times, 0.3)
+        self.assertEqual(
+            list(trafgrapher.grouper().stream(
+                [(row[0], row[1:]) for row in rows], self.now)),
+            sorted(trafgrapher.grouper().load(
+                dict((row[0], row[1:]) for row in rows), self.now).items(),
+                reverse=True))
+
+    def test_incremental_equals_full(self):
+        copy = self.filename+".copy"
+        for seed in range(5):
+            rnd = random.Random(seed)
+            times = tier_times(self.now, 200)
+            write_log(self.filename, random_rows(rnd, times),
+                      (self.now, 0, 0))
+            later = self.now+86400
+            self.append(random_rows(
+                rnd, range(self.now+60, later+1, 60)), (later, 0, 0))
+            shutil.copy(self.filename, copy)
+            lf = trafgrapher.logfile(self.filename)
+            lf.incremental = True
+            lf.save()
+            trafgrapher.logfile(copy, True).save()
+            self.assertEqual(self.read(self.filename), self.read(copy))
+
+    def test_merge(self):
+        rnd = random.Random(3)
+        merge = os.path.join(self.tmpdir, "b.log")
+        rows1 = random_rows(rnd, sparse_times(rnd, self.now, 30))
+        rows2 = random_rows(rnd, sparse_times(rnd, self.now-3600, 30)
+                            + [row[0] for row in rows1[::3]])
+        rows2.sort(reverse=True)
+        write_log(self.filename, rows1)
+        write_log(merge, rows2)
+        lf = trafgrapher.logfile(self.filename, True)
+        lf.merge(merge)
+        lf.save()
+        # rows of merged logfile are used for same time
+        self.assertEqual(self.read(self.filename).splitlines()[1:],
+                         expected(rows1+rows2, self.now))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from logdata import trafgrapher
+
+
+class test_config(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "index.json")
+        trafgrapher.CONFIG_CACHE = {}  # daemon mode
+
+    def tearDown(self):
+        trafgrapher.CONFIG_CACHE = None
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, data, mtime):
+        with open(self.filename, "w") as f:
+            f.write(data)
+        os.utime(self.filename, (mtime, mtime))
+
+    def test_reload_invalid(self):
+        cfg = {"interval": 30, "ifs": {}}
+        self.write(json.dumps(cfg), 1000)
+        self.assertEqual(trafgrapher.read_config(self.filename),
+                         ("public", self.filename, cfg))
+        # previous config is kept until file is fixed
+        self.write('{"interval": ', 2000)
+        self.assertEqual(trafgrapher.read_config("x@"+self.filename),
+                         ("x", self.filename, cfg))
+        cfg["interval"] = 60
+        self.write(json.dumps(cfg), 3000)
+        self.assertEqual(trafgrapher.read_config(self.filename)[2], cfg)
+
+    def test_invalid(self):
+        self.write("[", 1000)
+        self.assertEqual(trafgrapher.read_config(self.filename)[2], None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from logdata import trafgrapher, tier_times, write_log
+
+
+class test_gzip(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "a.log")
+        self.now = 1790000000
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_append(self):
+        write_log(self.filename, [(t, 1, 2, 3, 4)
+                                  for t in tier_times(self.now, 10)])
+        trafgrapher.precompress(self.filename, ["gz"])
+        with open(self.filename+".br", "wb") as f:
+            f.write(b"outdated")
+        for t in range(self.now+60, self.now+600, 60):
+            lf = trafgrapher.logfile(self.filename)
+            lf.incremental = False
+            lf.counter = (t, 0, 0)
+            lf.save((t, 5, 6, 7, 8))
+            with open(self.filename, "rb") as f:
+                data = f.read()
+            with gzip.open(self.filename+".gz") as f:
+                self.assertEqual(f.read(), data)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)),
+                         ["a.log", "a.log.gz"])
+
+
+if __name__ == "__main__":
+    unittest.main()
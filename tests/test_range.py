@@ -0,0 +1,72 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from logdata import trafgrapher, tier_times, write_log
+
+
+class test_range(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "a.log")
+        self.now = 1790000000
+
+    def tearDown(self):
+        trafgrapher.LOG_INDEX = False
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, rnd, index):
+        times = tier_times(self.now, 100)
+        rows = [(t, rnd.randrange(10**6), None, rnd.randrange(10**6), 5)
+                for t in times]
+        # appended rows in ascending order
+        appended = [(t, rnd.randrange(10**6), 1, 2, None)
+                    for t in range(self.now+60, self.now+86400, 60)]
+        write_log(self.filename, rows+appended, (self.now+86400, 0, 0))
+        if index:
+            trafgrapher.LOG_INDEX = True
+            lf = trafgrapher.logfile.__new__(trafgrapher.logfile)
+            lf.filename = self.filename
+            lf.write_index()
+            self.assertTrue(os.path.exists(lf.index_name()))
+        return sorted((row[0], row[1:]) for row in rows+appended)
+
+    def check(self, rows, start, end):
+        lf = trafgrapher.logfile.__new__(trafgrapher.logfile)
+        lf.filename = self.filename
+        lf.f = open(self.filename, "rb")
+        try:
+            self.assertEqual(
+                [(t, list(values)) for t, values in lf.read_range(start, end)],
+                [(t, list(values)) for t, values in rows
+                 if start <= t <= end])
+            self.assertEqual(lf.count_range(start, end),
+                             len([t for t, values in rows
+                                  if start <= t <= end]))
+        finally:
+            lf.f.close()
+
+    def test_range(self):
+        for index in (False, True):
+            rnd = random.Random(index)
+            rows = self.write(rnd, index)
+            times = [t for t, values in rows]
+            bounds = [0, times[0], times[-1], self.now, self.now+1,
+                      self.now+2*86400]
+            for i in range(100):
+                t = rnd.choice(times)
+                bounds.extend([t, t-1, t+1])
+            for i in range(100):
+                start, end = sorted([rnd.choice(bounds), rnd.choice(bounds)])
+                self.check(rows, start, end)
+
+    def test_empty(self):
+        write_log(self.filename, [], (self.now, 0, 0))
+        self.check([], 0, self.now)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import contextlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from logdata import trafgrapher, write_log
+
+
+class test_ring(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "a.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def compare(self, now, seed):
+        rnd = random.Random(seed)
+        rows = [(t, rnd.randrange(1000, 2000), rnd.randrange(1000, 2000),
+                 rnd.randrange(10**6), rnd.randrange(10**6))
+                for t in range(now, now-80*86400, -60)]
+        write_log(self.filename, rows, (now, 0, 0))
+        with contextlib.redirect_stdout(io.StringIO()):
+            lf = trafgrapher.logfile_ring(self.filename)  # convert
+            lf.text_export = False
+            lf.save()
+        lf = trafgrapher.logfile_ring(self.filename, True)
+        ring = lf.deltas
+        grp = dict(trafgrapher.grouper().load(
+            dict((row[0], row[1:]) for row in rows), now).items())
+        self.assertEqual(sorted(ring), sorted(grp))
+        boundary = 0
+        for t in grp:
+            # rows overlapping tiers are counted once
+            self.assertAlmostEqual(ring[t][0], grp[t][0])
+            self.assertAlmostEqual(ring[t][1], grp[t][1])
+            # maximum of slot on tier boundary may include newer rows
+            self.assertGreaterEqual(ring[t][2], grp[t][2])
+            self.assertGreaterEqual(ring[t][3], grp[t][3])
+            if list(ring[t][2:]) != list(grp[t][2:]):
+                boundary += 1
+        self.assertLessEqual(boundary, len(lf.tiers)-1)
+
+    def test_load_aligned(self):
+        self.compare(1790013600//21600*21600, 1)
+
+    def test_load(self):
+        self.compare(1790013600//21600*21600+120, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from logdata import trafgrapher
+
+
+class test_rollup(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "a.log")
+        self.rollups = {"1h": 3600, "1d": 86400}
+        self.now = 1790000000
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def open(self):
+        lf = trafgrapher.logfile(self.filename)
+        lf.incremental = False  # compression is tested separately
+        lf.rollups = self.rollups
+        lf.rollup_rows = 24
+        return lf
+
+    def read(self, filename):
+        with open(filename) as f:
+            return f.read()
+
+    def test_append(self):
+        rnd = random.Random(0)
+        for t in range(self.now, self.now+3*86400, 60):
+            lf = self.open()
+            lf.counter = (t, 0, 0)
+            lf.save((t, rnd.randrange(10**6, 2*10**6),
+                     rnd.randrange(10**6, 2*10**6),
+                     rnd.randrange(10**6), rnd.randrange(10**6)))
+            for name in self.rollups:
+                rows = self.read(lf.rollup_name(name)).splitlines()[1:]
+                self.assertLessEqual(len(rows), lf.rollup_rows)
+        appended = dict((name, self.read(lf.rollup_name(name)))
+                        for name in self.rollups)
+        lf = self.open()
+        lf.counter = (t, 0, 0)
+        lf.write_rollups()
+        for name in self.rollups:
+            lines = appended[name].splitlines()
+            regenerated = self.read(lf.rollup_name(name)).splitlines()
+            self.assertEqual(lines[0], regenerated[0])
+            self.assertEqual(len(lines), len(regenerated))
+            # ascending rows, folded averages are exact up to rounding
+            for row, expected in zip(lines[1:], regenerated[1:]):
+                row = [int(x) for x in row.split()]
+                expected = [int(x) for x in expected.split()]
+                self.assertEqual(row[0], expected[0])
+                for x, y in zip(row[1:3], expected[1:3]):
+                    self.assertAlmostEqual(x/float(y), 1, 3)
+                self.assertEqual(row[3:], expected[3:])
+        self.assertEqual(len(appended["1h"].splitlines()), lf.rollup_rows+1)
+
+
+if __name__ == "__main__":
+    unittest.main()
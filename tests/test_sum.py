@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from logdata import trafgrapher, tier_times, write_log
+
+
+class test_sum(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "a.log")
+        self.now = 1790000000
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_long_history(self):
+        # 1/4 day interval is float, group times must be packed as int
+        times = tier_times(self.now, 120)
+        write_log(self.filename, [(t, 1000, 2000, 1000, 2000)
+                                  for t in times])
+        trafgrapher.build_sum(self.filename)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ["a.log", "a.sum"])
+        for days in (1, 10, 30, 90, 110):
+            total_in, total_out = trafgrapher.read_total(
+                self.filename, self.now-days*86400, self.now)
+            self.assertAlmostEqual(total_in/(1000.0*days*86400), 1, 3)
+            self.assertAlmostEqual(total_out/(2000.0*days*86400), 1, 3)
+
+    def test_group_rate_forward(self):
+        # compressed row applies to [t, t+step), not to time before t
+        times = tier_times(self.now, 120)
+        border = (self.now-80*86400)//21600*21600
+        write_log(self.filename, [
+            (t, 1000 if t < border else 3000, 0, 0, 0) for t in times])
+        total_in = trafgrapher.read_total(
+            self.filename, border-86400, border)[0]
+        self.assertEqual(total_in, 1000*86400)
+        total_in = trafgrapher.read_total(
+            self.filename, border, border+86400)[0]
+        self.assertEqual(total_in, 3000*86400)
+
+    def test_unsupported(self):
+        with open(self.filename, "w") as f:
+            f.write("x 1 2\n")
+        self.assertIsNone(trafgrapher.read_total(self.filename))
+        self.assertEqual(os.listdir(self.tmpdir), ["a.log"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from logdata import trafgrapher, tier_times, write_log
+
+
+class test_top(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.now = 1790000000
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, rnd, level):
+        '''
+        Write raw rows with irregular polling, short polls with high rate,
+        build daily summary and compress logfile.
+        '''
+        filename = os.path.join(self.tmpdir, name)
+        rows = []
+        t = self.now
+        while t > self.now-30*86400:
+            # one long poll and ten short polls in each 1/2 hour
+            for i in range(11):
+                rate = 100*level*rnd.random() if i else level*rnd.random()
+                rows.append((t, rate, rate/2, rate, rate/2))
+                t -= 30 if i else 1500  # poll interval ending at t
+        write_log(filename, rows[::-1], (self.now, 0, 0))
+        trafgrapher.build_summary(filename)
+        trafgrapher.logfile(filename, True).save()
+        return filename
+
+    def test_bound(self):
+        rnd = random.Random(0)
+        filename = self.write("a.log", rnd, 10**6)
+        for i in range(50):
+            start = self.now - rnd.randrange(14*86400, 28*86400)
+            end = start + rnd.choice([600, 3600, 21600, 86400, 7*86400])
+            if i % 2:
+                end = end//21600*21600+1  # just after group start
+            for metric in ("avg", "max", "total"):
+                value = trafgrapher.top_value(
+                    (filename, ""), start, end, metric)[2]
+                self.assertLessEqual(
+                    value, trafgrapher.top_bound(filename, start, end, metric))
+
+    def test_top(self):
+        rnd = random.Random(1)
+        filenames = [self.write("a%d.log" % i, rnd, rnd.choice([1, 10**6]))
+                     for i in range(10)]
+        start, end = self.now-20*86400, self.now-18*86400+1
+        for metric in ("avg", "max", "total"):
+            values = sorted(
+                (trafgrapher.top_value((filename, ""), start, end, metric)
+                 for filename in filenames),
+                key=lambda x: x[2], reverse=True)
+            self.assertEqual(
+                trafgrapher.top([self.tmpdir], 5, start, end, metric),
+                values[:5])
+
+
+if __name__ == "__main__":
+    unittest.main()